@@ -1,92 +1,120 @@
-import json
+import argparse
 import random
+import time
 from pathlib import Path
 
-# Set seed for reproducibility
-random.seed(100)
+from dataset_paths import HTML_DIR, add_partition_arguments, check_partition, output_path, owns, resume_stem
+from metrics import StageMetrics
+from resume_store import count_resumes, iter_indexed_resumes
+from template_cache import load_compiled_template, render_template
 
-TEMPLATES_DIR = Path("templates")
-DATA_PATH = Path("data/resumes")
-OUTPUT_DIR = Path("output/html")
-
-def render_all_resumes():
-    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-
-    resume_files = sorted(list(DATA_PATH.glob("*.json")))
-
-    for idx, resume_file in enumerate(resume_files, start=1):
-        # Randomly assign template from 1 to 10
-        template_id = random.randint(1, 10)
-        template_path = TEMPLATES_DIR / f"template_{template_id:02d}" / "resume.html"
-        # Randomly assign template from 1 to 10
-        template_id = random.randint(1, 10)
-        template_path = TEMPLATES_DIR / f"template_{template_id:02d}" / "resume.html"
+# Seed for template assignment (reproducibility)
+TEMPLATE_SEED = 100
+TEMPLATE_COUNT = 10
 
-        # Load resume data
-        with open(resume_file, "r", encoding="utf-8") as f:
-            data = json.load(f)
-
-        # Load template
-        with open(template_path, "r", encoding="utf-8") as f:
-            html = f.read()
+DATA_PATH = Path("data/resumes")
+OUTPUT_DIR = HTML_DIR
 
-        # Personal Info
-        html = html.replace("{{name}}", data["personal_info"]["name"])
-        html = html.replace("{{job_title}}", data["personal_info"]["job_title"])
-        html = html.replace("{{email}}", data["personal_info"]["email"])
-        html = html.replace("{{phone}}", data["personal_info"]["phone"])
-        html = html.replace("{{linkedin}}", data["personal_info"]["linkedin"])
-        html = html.replace("{{github}}", data["personal_info"]["github"])
+def template_for(idx, seed=TEMPLATE_SEED):
+    """Template ID (1-10) of the idx-th resume, derived from (seed, idx) only.
 
-        # Summary
-        html = html.replace("{{summary}}", data["summary"])
+    No state carries over between resumes, so the assignment does not depend
+    on which records a node renders or in what order.
+    """
+    return random.Random(f"{seed}:{idx}").randint(1, TEMPLATE_COUNT)
 
-        # Education
-        edu = data["education"][0]
-        education_html = f"""
+def build_slots(data):
+    """Build the HTML fragment for every template placeholder from resume data."""
+    # Education
+    edu = data["education"][0]
+    education_html = f"""
         <p>
             {edu['degree']} in {edu['field']}<br>
             {edu['institution']} ({edu['start_year']}–{edu['end_year']})
         </p>
         """
 
-        # Skills - Categorized
-        skills_html = "<div class='skills-grid'>"
-        for category, skills_list in data["skills"].items():
-            category_name = category.replace("_", " & ").title()
-            skills_html += f"<div class='skill-category'><strong>{category_name}:</strong> {', '.join(skills_list)}</div>"
-        skills_html += "</div>"
-
-        # Projects with bullet points
-        projects_html = ""
-        for p in data["projects"]:
-            projects_html += f"<div class='project'><strong>{p['title']}</strong><ul>"
-            for bullet in p['description']:
-                projects_html += f"<li>{bullet}</li>"
-            projects_html += "</ul></div>"
-
-        # Experience with bullet points
-        experience_html = "<div class='experience'>"
-        for bullet in data["experience"]:
-            experience_html += f"<li>{bullet}</li>"
-        experience_html = "<ul>" + experience_html + "</ul></div>"
-
+    # Skills - Categorized
+    skills_html = "<div class='skills-grid'>" + "".join(
+        f"<div class='skill-category'><strong>{category.replace('_', ' & ').title()}:</strong> {', '.join(skills_list)}</div>"
+        for category, skills_list in data["skills"].items()
+    ) + "</div>"
+
+    # Projects with bullet points
+    projects_html = "".join(
+        f"<div class='project'><strong>{p['title']}</strong><ul>"
+        + "".join(f"<li>{bullet}</li>" for bullet in p["description"])
+        + "</ul></div>"
+        for p in data["projects"]
+    )
+
+    # Experience with bullet points
+    experience_html = "<ul><div class='experience'>" + "".join(
+        f"<li>{bullet}</li>" for bullet in data["experience"]
+    ) + "</ul></div>"
+
+    info = data["personal_info"]
+    return {
+        # Personal Info
+        "name": info["name"],
+        "job_title": info["job_title"],
+        "email": info["email"],
+        "phone": info["phone"],
+        "linkedin": info["linkedin"],
+        "github": info["github"],
+        # Summary
+        "summary": data["summary"],
+        "education": education_html,
+        "skills": skills_html,
+        "projects": projects_html,
+        "experience": experience_html,
         # Hobbies
-        hobbies_html = ", ".join(data["hobbies"])
-
-        # Replace placeholders
-        html = html.replace("{{education}}", education_html)
-        html = html.replace("{{skills}}", skills_html)
-        html = html.replace("{{projects}}", projects_html)
-        html = html.replace("{{experience}}", experience_html)
-        html = html.replace("{{hobbies}}", hobbies_html)
-
-        # Output file with template ID encoded in filename
-        output_file = OUTPUT_DIR / f"resume_{idx:04d}_t{template_id:02d}.html"
+        "hobbies": ", ".join(data["hobbies"])
+    }
+
+def render_resume_html(data, template_id):
+    """Render one resume to self-contained HTML with the given template."""
+    return render_template(load_compiled_template(template_id), build_slots(data))
+
+def render_resumes(resumes, template_ids):
+    """Render a list of resume dicts in memory, one template ID per resume."""
+    return [render_resume_html(data, t) for data, t in zip(resumes, template_ids)]
+
+def render_all_resumes(seed=TEMPLATE_SEED, shard_index=0, shard_count=1, data_dir=DATA_PATH, output_dir=OUTPUT_DIR):
+    """Render every resume record in data_dir (or node shard_index's part) to HTML in output_dir.
+
+    Returns (resumes rendered, failures); failures is always empty, as any
+    error aborts the stage.
+    """
+    check_partition(shard_index, shard_count)
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    metrics = StageMetrics("render", total=count_resumes(data_dir) if shard_count == 1 else None)
+
+    # Streams JSONL shards when present, else the per-resume JSON files
+    for idx, data in iter_indexed_resumes(data_dir):
+        if not owns(idx, shard_index, shard_count):
+            continue
+        start = time.perf_counter()
+        template_id = template_for(idx, seed)
+        html = render_resume_html(data, template_id)
+
+        # Output file with template ID encoded in filename, in its shard directory
+        output_file = output_path(output_dir, resume_stem(idx, template_id), ".html")
         with open(output_file, "w", encoding="utf-8") as f:
             f.write(html)
 
-        print(f"Generated: {output_file.name} (Template {template_id:02d})")
+        metrics.record(time.perf_counter() - start, bytes_written=output_file.stat().st_size)
+
+    metrics.save()
+    print(f"✓ Rendered {metrics.items} resumes to {output_dir}")
+    return metrics.items, []
 
 if __name__ == "__main__":
-    render_all_resumes()
+    parser = argparse.ArgumentParser(description="Render every resume record to HTML.")
+    parser.add_argument("--seed", type=int, default=TEMPLATE_SEED,
+                        help="seed of the template assignment")
+    add_partition_arguments(parser)
+    args = parser.parse_args()
+    render_all_resumes(seed=args.seed, shard_index=args.shard_index, shard_count=args.shard_count)
@@ -0,0 +1,62 @@
+"""
+Benchmark per-resume HTML render latency.
+
+Compares the compiled template engine (batch_render.render_resume_html)
+against the previous approach of re-reading resume.html and running one
+str.replace pass per placeholder.
+
+Usage: python benchmarks/bench_render.py [num_resumes]
+"""
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+os.chdir(ROOT)  # templates/ is resolved relative to the repo root
+
+from batch_render import build_slots, render_resume_html
+from generate_resumes import generate_resume
+from template_cache import template_dir
+
+def render_naive(data, template_id):
+    """Pre-compilation render: read the template and replace each slot in turn."""
+    with open(template_dir(template_id) / "resume.html", "r", encoding="utf-8") as f:
+        html = f.read()
+    for name, value in build_slots(data).items():
+        html = html.replace(f"{{{{{name}}}}}", value)
+    return html
+
+def time_render(render, resumes, template_ids):
+    """Return per-resume latencies in microseconds."""
+    latencies = []
+    for data, template_id in zip(resumes, template_ids):
+        start = time.perf_counter()
+        render(data, template_id)
+        latencies.append((time.perf_counter() - start) * 1e6)
+    return latencies
+
+def report(name, latencies):
+    latencies = sorted(latencies)
+    p95 = latencies[int(0.95 * (len(latencies) - 1))]
+    total = sum(latencies) / 1e6
+    print(f"  {name:<10} mean {statistics.mean(latencies):8.1f} µs | "
+          f"p50 {statistics.median(latencies):8.1f} µs | p95 {p95:8.1f} µs | "
+          f"{len(latencies) / total:10.0f} resumes/s")
+
+def main(n=2000):
+    resumes = [generate_resume() for _ in range(n)]
+    template_ids = [i % 10 + 1 for i in range(n)]
+
+    # Warm the template caches so only steady-state rendering is timed
+    for template_id in range(1, 11):
+        render_resume_html(resumes[0], template_id)
+
+    print(f"Rendering {n} resumes (in memory, no output files)")
+    report("naive", time_render(render_naive, resumes, template_ids))
+    report("compiled", time_render(render_resume_html, resumes, template_ids))
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
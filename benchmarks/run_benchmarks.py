@@ -0,0 +1,327 @@
+"""
+Benchmark every pipeline stage in isolation and end to end.
+
+Inputs come from benchmarks/fixtures/resumes.jsonl (three resumes per
+template), repeated to reach each dataset size. Every size runs in a fresh
+temporary directory, so the repository's output/ is never touched. Each
+benchmark is repeated and the median time is reported; the result file
+(benchmarks/results/<label>.json) has a stable layout so two runs can be
+compared with --compare.
+
+Stages that need an external tool (wkhtmltopdf, wkhtmltoimage, pdftoppm or PyMuPDF) are
+skipped when it is not installed. Without rasterized pages the noise and
+annotation benchmarks run on synthetic pages instead. File-based
+benchmarks count their outputs and are marked incomplete when a stage
+produced fewer files than expected.
+
+Usage:
+    python benchmarks/run_benchmarks.py [--sizes 10 50] [--repeat 3] [--label NAME]
+    python benchmarks/run_benchmarks.py --compare results/base.json results/new.json
+    python benchmarks/run_benchmarks.py --write-fixtures
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+os.chdir(ROOT)  # templates/ is resolved relative to the repo root
+
+import html_to_image
+import html_to_pdf
+import page_stage
+import pdf_to_image
+from add_noise import add_noise_and_augment
+from batch_render import render_all_resumes, render_resume_html
+from create_annotations import create_annotations
+from dataset_paths import iter_files, output_path, resume_stem
+from generate_resumes import SEED, generate_resume, generate_resumes_batch
+from resume_store import write_shards
+from template_cache import template_dir
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures" / "resumes.jsonl"
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+FIXTURES_PER_TEMPLATE = 3
+TEMPLATE_IDS = range(1, 11)
+
+DEFAULT_SIZES = (10, 50)
+DEFAULT_REPEAT = 3
+
+# -------------------------------
+# FIXTURES & ENVIRONMENT
+# -------------------------------
+
+def write_fixtures(path=FIXTURES):
+    """Regenerate the bundled fixture resumes (deterministic)."""
+    n = FIXTURES_PER_TEMPLATE * len(TEMPLATE_IDS)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        for i, resume in enumerate(generate_resumes_batch(n, seed=SEED)):
+            record = {"template_id": TEMPLATE_IDS[i % len(TEMPLATE_IDS)], "resume": resume}
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    print(f"✓ Wrote {n} fixture resumes to {path}")
+
+def load_fixtures(n):
+    """n (resume, template_id) pairs, cycling through the fixtures."""
+    with open(FIXTURES, "r", encoding="utf-8") as f:
+        records = [json.loads(line) for line in f]
+    return [(records[i % len(records)]["resume"], records[i % len(records)]["template_id"]) for i in range(n)]
+
+def find_tool(configured, name):
+    """The configured executable if it exists, else the one on PATH, else None."""
+    if Path(configured).exists():
+        return configured
+    return shutil.which(name)
+
+def environment():
+    import numpy
+    import PIL
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True
+        ).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": numpy.__version__,
+        "pillow": PIL.__version__,
+        "pymupdf": pdf_to_image.fitz is not None,
+        "git_commit": commit
+    }
+
+@contextlib.contextmanager
+def workdir():
+    """Run inside a fresh temporary directory that sees the repo's templates/."""
+    previous = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="resume_bench_") as tmp:
+        tmp = Path(tmp)
+        try:
+            (tmp / "templates").symlink_to(ROOT / "templates", target_is_directory=True)
+        except OSError:  # e.g. Windows without symlink rights
+            shutil.copytree(ROOT / "templates", tmp / "templates")
+        for sub in ("data/resumes", "output/html", "output/pdf", "output/images/clean",
+                    "output/images/noisy", "annotations"):
+            (tmp / sub).mkdir(parents=True, exist_ok=True)
+        os.chdir(tmp)
+        try:
+            yield tmp
+        finally:
+            os.chdir(previous)
+
+def reset(*dirs):
+    for d in dirs:
+        shutil.rmtree(d, ignore_errors=True)
+        Path(d).mkdir(parents=True, exist_ok=True)
+
+def synthetic_pages(pairs, out_dir=Path("output/images/clean")):
+    """A4 pages at 300 DPI, as the rasterizers make, with a text-like block per section.
+
+    Used when no rasterizer exists.
+    """
+    from PIL import Image, ImageDraw
+    reset(out_dir)
+    width, height = html_to_image.page_pixels()
+    for idx, (_, template_id) in enumerate(pairs, start=1):
+        img = Image.new("RGB", (width, height), "white")
+        draw = ImageDraw.Draw(img)
+        for top in range(150, height - 350, 500):
+            for y in range(top, top + 320, 45):
+                draw.rectangle([200, y, width - 200 - (y * 7) % 400, y + 25], fill="black")
+        img.save(output_path(out_dir, resume_stem(idx, template_id), ".png"))
+
+# -------------------------------
+# BENCHMARKS
+# -------------------------------
+
+def measure(run, setup=None, repeat=DEFAULT_REPEAT):
+    """Median and all wall times of run() over repeat runs; setup() is untimed."""
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            run()
+            times.append(time.perf_counter() - start)
+    return statistics.median(times), times
+
+def bench_size(n, repeat, tools):
+    """Run every benchmark at dataset size n; returns a list of result dicts."""
+    pairs = load_fixtures(n)
+    resumes = [r for r, _ in pairs]
+    results = []
+
+    def record(name, run=None, setup=None, skip=None, outputs=None):
+        """Benchmark run(); outputs is (directory, suffix) holding one file per item."""
+        if skip:
+            results.append({"benchmark": name, "size": n, "status": f"skipped: {skip}"})
+            print(f"  {name:<16} skipped ({skip})")
+            return
+        median, times = measure(run, setup, repeat)
+        status = "ok"
+        if outputs is not None:
+            produced = sum(1 for _ in iter_files(outputs[0], outputs[1]))
+            if produced != n:
+                status = f"incomplete: {produced}/{n} outputs"
+        results.append({
+            "benchmark": name,
+            "size": n,
+            "status": status,
+            "median_s": round(median, 6),
+            "times_s": [round(t, 6) for t in times],
+            "items_per_sec": round(n / median, 2) if median > 0 else None
+        })
+        note = "" if status == "ok" else f"  ⚠️  {status}"
+        print(f"  {name:<16} {median:9.4f} s  {n / median:10.1f} items/s{note}")
+
+    # In-memory stages
+    record("generate", lambda: [generate_resume() for _ in range(n)])
+    record("generate_batch", lambda: generate_resumes_batch(n))
+
+    raw_html = {}
+    for template_id in TEMPLATE_IDS:
+        with open(template_dir(template_id) / "resume.html", "r", encoding="utf-8") as f:
+            raw_html[template_id] = f.read()
+    record("css_inline", lambda: [
+        html_to_pdf.inline_css_in_html(raw_html[t], f"{t:02d}") for _, t in pairs
+    ])
+    record("render", lambda: [render_resume_html(r, t) for r, t in pairs])
+
+    # File-based stages, each on the previous stage's output
+    with workdir():
+        write_shards(resumes)
+        record("render_files", render_all_resumes, setup=lambda: reset("output/html"),
+               outputs=("output/html", ".html"))
+
+        no_pdf = None if tools["wkhtmltopdf"] else "wkhtmltopdf not found"
+        record("html_to_pdf", html_to_pdf.convert_html_to_pdf,
+               setup=lambda: reset("output/pdf"), skip=no_pdf, outputs=("output/pdf", ".pdf"))
+
+        no_raster = no_pdf or (None if tools["raster"] else "no pdftoppm or PyMuPDF")
+        record("pdf_to_png", lambda: pdf_to_image.convert_pdf_to_images(output_dir="output/images/clean"),
+               setup=lambda: reset("output/images/clean"), skip=no_raster,
+               outputs=("output/images/clean", ".png"))
+        # HTML straight to PNG, the PDF-free alternative to html_to_pdf + pdf_to_png
+        no_direct = None if tools["wkhtmltoimage"] else "wkhtmltoimage not found"
+        record("html_to_png", lambda: html_to_image.convert_html_to_images(output_dir="output/images/direct"),
+               setup=lambda: reset("output/images/direct"), skip=no_direct,
+               outputs=("output/images/direct", ".png"))
+        if no_raster or next(iter_files("output/images/clean", ".png"), None) is None:
+            synthetic_pages(pairs)
+
+        # Labels first, as in the pipeline, so add_noise also writes the rotated noisy labels
+        record("annotate", create_annotations, setup=lambda: reset("annotations"),
+               outputs=("annotations", ".txt"))
+        record("add_noise", add_noise_and_augment, setup=lambda: reset("output/images/noisy", "annotations/noisy"),
+               outputs=("output/images/noisy", ".png"))
+        # pdf_to_png + add_noise + annotate with one decode per page
+        record("page_stage", page_stage.run_page_stage,
+               setup=lambda: reset("output/images/clean", "output/images/noisy", "annotations"),
+               skip=no_raster, outputs=("annotations", ".txt"))
+
+    # End to end, from fixture records to noisy images and labels, in run_full_pipeline's order
+    def end_to_end():
+        write_shards(resumes)
+        render_all_resumes()
+        html_to_pdf.convert_html_to_pdf()
+        pdf_to_image.convert_pdf_to_images(output_dir="output/images/clean")
+        create_annotations()
+        add_noise_and_augment()
+
+    with workdir():
+        record(
+            "end_to_end", end_to_end,
+            setup=lambda: reset("data/resumes", "output", "annotations"),
+            skip=no_raster,
+            outputs=("annotations", ".txt")
+        )
+
+    return results
+
+def run(sizes, repeat, label):
+    if not FIXTURES.exists():
+        write_fixtures()
+
+    tools = {
+        "wkhtmltopdf": find_tool(html_to_pdf.WKHTMLTOPDF_PATH, "wkhtmltopdf"),
+        "wkhtmltoimage": find_tool(html_to_image.WKHTMLTOIMAGE_PATH, "wkhtmltoimage"),
+        "pdftoppm": find_tool(pdf_to_image.PDFTOPPM, "pdftoppm"),
+    }
+    if tools["wkhtmltopdf"]:
+        html_to_pdf.WKHTMLTOPDF_PATH = tools["wkhtmltopdf"]
+    if tools["wkhtmltoimage"]:
+        html_to_image.WKHTMLTOIMAGE_PATH = tools["wkhtmltoimage"]
+    if tools["pdftoppm"]:
+        pdf_to_image.PDFTOPPM = tools["pdftoppm"]
+    tools["raster"] = tools["pdftoppm"] or pdf_to_image.fitz is not None
+
+    results = []
+    for n in sizes:
+        print(f"\nDataset size {n} (median of {repeat}):")
+        results.extend(bench_size(n, repeat, tools))
+
+    RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+    out_path = RESULTS_DIR / f"{label}.json"
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump({
+            "label": label,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "environment": environment(),
+            "tools": {k: v for k, v in tools.items() if k != "raster"},
+            "sizes": list(sizes),
+            "repeat": repeat,
+            "results": results
+        }, f, indent=2, sort_keys=True)
+    print(f"\n✓ Results written to {out_path}")
+    return out_path
+
+def compare(base_path, new_path):
+    """Print the speed change of every benchmark present in both result files."""
+    def load(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return {
+                (r["benchmark"], r["size"]): r
+                for r in json.load(f)["results"] if r["status"] == "ok"
+            }
+
+    base, new = load(base_path), load(new_path)
+    print(f"{'Benchmark':<16}{'Size':>7}{'Base s':>11}{'New s':>11}{'Change':>9}")
+    for key in sorted(base.keys() & new.keys(), key=lambda k: (k[1], k[0])):
+        b, c = base[key]["median_s"], new[key]["median_s"]
+        change = (c - b) / b * 100 if b else 0.0
+        flag = " ⚠️" if change > 10 else ""
+        print(f"{key[0]:<16}{key[1]:>7}{b:>11.4f}{c:>11.4f}{change:>+8.1f}%{flag}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the resume pipeline stages.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES),
+                        help="dataset sizes to benchmark")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT,
+                        help="runs per benchmark; the median is reported")
+    parser.add_argument("--label", default=time.strftime("%Y%m%d-%H%M%S"),
+                        help="result file name (default: timestamp)")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "NEW"),
+                        help="compare two result files instead of running")
+    parser.add_argument("--write-fixtures", action="store_true",
+                        help="regenerate benchmarks/fixtures/resumes.jsonl")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+    elif args.write_fixtures:
+        write_fixtures()
+    else:
+        run(args.sizes, args.repeat, args.label)
@@ -1,12 +1,23 @@
-from PIL import Image
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from pathlib import Path
+import argparse
+import itertools
 import json
+import math
+import os
 import re
+import time
+
+from dataset_paths import ANNOT_DIR, CLEAN_DIR, IMAGE_SUFFIXES, PDF_DIR, item_path, iter_files, output_path
+from dataset_paths import add_partition_arguments, check_partition, owns_stem
+from html_to_pdf import INDEX_SUFFIX
+from measure_layout import load_ink_mask, measure_sections, section_bounds
+from metrics import StageMetrics, timed
 
-IMAGE_DIR = Path("output/images/clean")
-ANNOT_DIR = Path("annotations")
 TEMPLATES_DIR = Path("templates")
-ANNOT_DIR.mkdir(parents=True, exist_ok=True)
+MAX_WORKERS = os.cpu_count() or 4
+CHUNKSIZE = 64  # images per task in measured mode
 
 # YOLO class mapping:
 # 0 header, 1 education, 2 skills, 3 projects, 4 experience, 5 hobbies
@@ -20,73 +31,214 @@ CLASS_MAP = {
     "hobbies": 5
 }
 
+TEMPLATE_ID_RE = re.compile(r'_t(\d{2})')
+
 def extract_template_id(filename):
-    """Extract template ID from filename like 'resume_0042_t07-1.png' -> '07'"""
-    match = re.search(r'_t(\d{2})', filename)
+    """Extract template ID from filename like 'resume_0000042_t07.png' -> '07'"""
+    match = TEMPLATE_ID_RE.search(filename)
     if match:
         return match.group(1)
     return "01"  # Default to template 01 if not found
 
-def create_annotations():
-    image_files = list(IMAGE_DIR.glob("*.png"))
+def load_page_templates(pdf_dir=PDF_DIR):
+    """Map image stems to template IDs using the batched-PDF page indexes in pdf_dir."""
+    templates = {}
+    for index_path in Path(pdf_dir).glob(f"*{INDEX_SUFFIX}"):
+        with open(index_path, "r", encoding="utf-8") as f:
+            for entry in json.load(f)["pages"]:
+                templates[entry["stem"]] = entry["template_id"]
+    return templates
+
+@lru_cache(maxsize=None)
+def load_layout(template_id):
+    """Load a template's layout_config.json, or None if it has none."""
+    config_path = TEMPLATES_DIR / f"template_{template_id}" / "layout_config.json"
+
+    if not config_path.exists():
+        return None
+
+    with open(config_path, "r") as f:
+        return json.load(f)
+
+def yolo_lines(boxes):
+    """YOLO label lines for (section_name, (x_start, y_start, x_end, y_end)) pairs."""
+    lines = []
+    for section_name, (x_start, y_start, x_end, y_end) in boxes:
+        if section_name not in CLASS_MAP:
+            continue
+
+        class_id = CLASS_MAP[section_name]
+
+        # Calculate YOLO format: class x_center y_center width height (all normalized)
+        x_center = (x_start + x_end) / 2
+        y_center = (y_start + y_end) / 2
+        box_w = x_end - x_start
+        box_h = y_end - y_start
+
+        lines.append(
+            f"{class_id} {x_center:.6f} {y_center:.6f} {box_w:.6f} {box_h:.6f}"
+        )
+
+    return lines
+
+def annotation_lines(layout):
+    """YOLO label lines for every known section of a layout, as configured."""
+    return yolo_lines(
+        (section_name, section_bounds(bounds))
+        for section_name, bounds in layout["sections"].items()
+    )
+
+def ink_label_text(ink, layout):
+    """YOLO label file contents with section boxes measured from a page's ink mask."""
+    boxes = measure_sections(ink, layout)
+    return "\n".join(yolo_lines(boxes.items()))
+
+def measured_label_text(img_path, layout):
+    """YOLO label file contents with section boxes measured from the clean image."""
+    return ink_label_text(load_ink_mask(img_path), layout)
+
+@lru_cache(maxsize=None)
+def label_text(template_id):
+    """YOLO label file contents for a template, or None if it has no layout.
+
+    Coordinates are normalized, so every image rendered from a template
+    gets the same label; it is computed once per template.
+    """
+    layout = load_layout(template_id)
+    if layout is None:
+        return None
+    return "\n".join(annotation_lines(layout))
 
-    if not image_files:
+def rotate_label_text(text, angle, width, height):
+    """YOLO label text for a width x height page rotated by angle degrees.
+
+    Matches PIL's Image.rotate(angle, expand=False): counter-clockwise about
+    the page centre. Each box becomes the bounding box of its rotated corners,
+    clipped to the page.
+    """
+    theta = math.radians(angle)
+    cos, sin = math.cos(theta), math.sin(theta)
+    cx, cy = width / 2, height / 2
+    lines = []
+    for line in text.splitlines():
+        class_id, x_center, y_center, box_w, box_h = line.split()
+        x_center, box_w = float(x_center) * width, float(box_w) * width
+        y_center, box_h = float(y_center) * height, float(box_h) * height
+
+        # Pixel y grows downwards, so a counter-clockwise turn maps (dx, dy) -> (dx*cos + dy*sin, dy*cos - dx*sin)
+        xs, ys = [], []
+        for dx in (x_center - box_w / 2 - cx, x_center + box_w / 2 - cx):
+            for dy in (y_center - box_h / 2 - cy, y_center + box_h / 2 - cy):
+                xs.append(cx + dx * cos + dy * sin)
+                ys.append(cy + dy * cos - dx * sin)
+
+        x_start, x_end = max(min(xs), 0) / width, min(max(xs), width) / width
+        y_start, y_end = max(min(ys), 0) / height, min(max(ys), height) / height
+        if x_end <= x_start or y_end <= y_start:
+            continue  # rotated off the page
+        lines.append(
+            f"{class_id} {(x_start + x_end) / 2:.6f} {(y_start + y_end) / 2:.6f} "
+            f"{x_end - x_start:.6f} {y_end - y_start:.6f}"
+        )
+    return "\n".join(lines)
+
+def write_annotation(image_stem, text, annot_dir=ANNOT_DIR):
+    """Write a YOLO label file for one image and return its path."""
+    label_path = output_path(annot_dir, image_stem, ".txt")
+    with open(label_path, "w") as f:
+        f.write(text)
+    return label_path
+
+def _measure_one(img_path, template_id, annot_dir=ANNOT_DIR):
+    """Worker entry point for measured mode. Returns (img_path, error or None)."""
+    try:
+        text = measured_label_text(img_path, load_layout(template_id))
+        write_annotation(img_path.stem, text, annot_dir)
+        return img_path, None
+    except Exception as e:
+        return img_path, str(e)
+
+def create_annotations(measured=False, workers=MAX_WORKERS, shard_index=0, shard_count=1,
+                       clean_dir=CLEAN_DIR, annot_dir=ANNOT_DIR, pdf_dir=PDF_DIR):
+    """Write a YOLO label to annot_dir per image in clean_dir (or per image of node shard_index's part).
+
+    By default labels are the template's configured boxes. With
+    measured=True each page is analysed (see measure_layout.py) in a
+    process pool and gets boxes fitted to its actual content.
+    Returns (labels written, failures); images whose template has no
+    layout_config.json are failures too.
+    """
+    check_partition(shard_index, shard_count)
+    Path(annot_dir).mkdir(parents=True, exist_ok=True)
+    image_paths = [
+        path for path in iter_files(clean_dir, IMAGE_SUFFIXES) if owns_stem(path.stem, shard_index, shard_count)
+    ]
+
+    if not image_paths:
         print("No images found in clean folder.")
-        return
-
-    for img_path in image_files:
-        # Extract template ID from filename
-        template_id = extract_template_id(img_path.name)
-        
-        # Load layout configuration for this template
-        config_path = TEMPLATES_DIR / f"template_{template_id}" / "layout_config.json"
-        
-        if not config_path.exists():
+        return 0, []
+
+    page_templates = load_page_templates(pdf_dir)
+    written = 0
+    failures = []
+    jobs = []
+    metrics = StageMetrics("annotate", total=len(image_paths), workers=workers if measured else 1)
+
+    for img_path in image_paths:
+        stem = img_path.stem
+        # Template ID from the batch index, falling back to the filename
+        template_id = page_templates.get(stem) or extract_template_id(stem)
+
+        text = label_text(template_id)
+        if text is None:
             print(f"⚠️  Config not found for template {template_id}, skipping {img_path.name}")
+            failures.append((img_path, f"no layout_config.json for template {template_id}"))
             continue
-            
-        with open(config_path, "r") as f:
-            layout = json.load(f)
-        
-        # Get image dimensions
-        img = Image.open(img_path)
-        w, h = img.size
-
-        lines = []
-        
-        # Generate YOLO format annotations based on layout config
-        for section_name, bounds in layout["sections"].items():
-            if section_name not in CLASS_MAP:
-                continue
-                
-            class_id = CLASS_MAP[section_name]
-            
-            # Extract bounds (support both full and simple formats)
-            x_start = bounds.get("x_start", 0.0)
-            x_end = bounds.get("x_end", 1.0)
-            y_start = bounds.get("y_start", bounds.get("y0", 0.0))  # Fallback to y0/y1
-            y_end = bounds.get("y_end", bounds.get("y1", 1.0))
-            
-            # Calculate YOLO format: class x_center y_center width height (all normalized)
-            x_center = (x_start + x_end) / 2
-            y_center = (y_start + y_end) / 2
-            box_w = x_end - x_start
-            box_h = y_end - y_start
-
-            lines.append(
-                f"{class_id} {x_center:.6f} {y_center:.6f} {box_w:.6f} {box_h:.6f}"
-            )
 
-            lines.append(
-                f"{class_id} {x_center:.6f} {y_center:.6f} {box_w:.6f} {box_h:.6f}"
+        if measured:
+            jobs.append((img_path, template_id))
+            continue
+
+        start = time.perf_counter()
+        write_annotation(stem, text, annot_dir)
+        written += 1
+        metrics.record(time.perf_counter() - start, bytes_written=len(text))
+
+    if jobs:
+        print(f"Measuring {len(jobs)} pages with {workers} workers...")
+        paths, template_ids = zip(*jobs)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = pool.map(
+                timed, itertools.repeat(_measure_one), paths, template_ids, itertools.repeat(annot_dir),
+                chunksize=CHUNKSIZE
             )
+            for seconds, (img_path, error) in results:
+                if error is not None:
+                    metrics.record(seconds, failed=True)
+                    print(f"❌ Failed: {img_path.name} → {error}")
+                    failures.append((img_path, error))
+                    continue
+                written += 1
+                metrics.record(seconds, bytes_written=item_path(annot_dir, img_path.stem, ".txt").stat().st_size)
 
-        # Save annotation file
-        label_path = ANNOT_DIR / f"{img_path.stem}.txt"
-        with open(label_path, "w") as f:
-            f.write("\n".join(lines))
+    metrics.save()
+    print(f"\n✓ Annotations Complete!")
+    print(f"  Labels: {written}")
+    print(f"  Skipped: {len(failures)}")
 
-        print(f"✓ {label_path.name} (Template {template_id})")
+    return written, failures
 
 if __name__ == "__main__":
-    create_annotations()
+    parser = argparse.ArgumentParser(description="Create YOLO labels for the clean images.")
+    parser.add_argument("--measured", action="store_true",
+                        help="fit each section box to the rendered page instead of using the template's fractions")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS,
+                        help="worker processes in measured mode")
+    add_partition_arguments(parser)
+    args = parser.parse_args()
+    create_annotations(
+        measured=args.measured,
+        workers=args.workers,
+        shard_index=args.shard_index,
+        shard_count=args.shard_count
+    )
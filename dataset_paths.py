@@ -0,0 +1,146 @@
+"""
+Shared file naming and directory layout for per-resume outputs.
+
+Every resume is identified by a stem such as resume_0000042_t07 (7-digit
+index, so names sort correctly up to 9,999,999 resumes, plus the template
+ID). Per-resume files are not kept in one flat directory: each stage's
+directory is split into range-based shard subdirectories of SHARD_SPAN
+resumes each, so no directory holds more than a few thousand entries and
+neighbouring resumes stay together:
+
+    output/images/clean/0000/resume_0000001_t03.png
+    output/images/clean/0000/resume_0001000_t08.png
+    output/images/clean/0001/resume_0001001_t01.png
+    ...
+
+iter_files() also yields files found directly in the stage directory, so
+flat outputs from older runs (e.g. resume_0042_t07.png) are still read.
+
+The same shards are the unit of work when several nodes split a dataset
+(--shard-index/--shard-count on every stage): node i of N handles shards
+i, i + N, i + 2N, ..., so nodes write disjoint directories whatever the
+dataset size, and merge_nodes.py combines them.
+"""
+import os
+import re
+from pathlib import Path
+
+HTML_DIR = Path("output/html")
+PDF_DIR = Path("output/pdf")
+IMAGE_DIR = Path("output/images")
+CLEAN_DIR = IMAGE_DIR / "clean"
+NOISY_DIR = IMAGE_DIR / "noisy"
+ANNOT_DIR = Path("annotations")
+NOISY_ANNOT_DIR = ANNOT_DIR / "noisy"  # labels of the (rotated) noisy variants
+
+# Page images may be PNG, lossless WebP or JPEG (see page_stage.py)
+IMAGE_SUFFIXES = (".png", ".webp", ".jpg")
+
+ID_WIDTH = 7        # digits in the resume index
+SHARD_SPAN = 1000   # resumes per shard subdirectory
+
+# Noisy variant k > 0 of a resume is stored as <stem>_v<k>
+STEM_RE = re.compile(r'^resume_(\d+)_t(\d{2})(?:_v\d+)?$')
+
+def resume_stem(idx, template_id):
+    """File stem for the idx-th resume (1-based), encoding its template ID."""
+    return f"resume_{idx:0{ID_WIDTH}d}_t{template_id:02d}"
+
+def parse_stem(stem):
+    """Return (idx, template_id) for a resume stem, or None for any other name."""
+    match = STEM_RE.match(stem)
+    if match is None:
+        return None
+    return int(match.group(1)), int(match.group(2))
+
+def variant_stem(stem, variant):
+    """Stem of a resume's noisy variant; variant 0 keeps the resume's own stem."""
+    return stem if variant == 0 else f"{stem}_v{variant}"
+
+def base_stem(stem):
+    """The resume stem of a variant stem."""
+    return stem.split("_v", 1)[0]
+
+def shard_name(idx):
+    """Shard subdirectory for the idx-th resume, e.g. 1..1000 -> '0000'."""
+    return f"{(idx - 1) // SHARD_SPAN:04d}"
+
+def item_path(base_dir, stem, suffix):
+    """Where a resume's file lives under base_dir.
+
+    Resume stems go to their shard subdirectory; any other name (e.g. a
+    batch PDF) stays directly in base_dir.
+    """
+    parsed = parse_stem(stem)
+    if parsed is None:
+        return Path(base_dir) / f"{stem}{suffix}"
+    return Path(base_dir) / shard_name(parsed[0]) / f"{stem}{suffix}"
+
+def output_path(base_dir, stem, suffix):
+    """item_path(), creating its shard subdirectory if needed."""
+    path = item_path(base_dir, stem, suffix)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    return path
+
+def find_image(base_dir, stem):
+    """Path of a resume's page image in base_dir in any IMAGE_SUFFIXES format, or None."""
+    for suffix in IMAGE_SUFFIXES:
+        path = item_path(base_dir, stem, suffix)
+        if path.exists():
+            return path
+    return None
+
+def find_variants(base_dir, stem):
+    """Paths of a resume's noisy variants (stem, stem_v1, stem_v2, ...) in base_dir."""
+    variants = []
+    while (path := find_image(base_dir, variant_stem(stem, len(variants)))) is not None:
+        variants.append(path)
+    return variants
+
+def check_partition(shard_index, shard_count):
+    if not 0 <= shard_index < shard_count:
+        raise ValueError(f"shard index {shard_index} is not in 0..{shard_count - 1}")
+
+def owns(idx, shard_index=0, shard_count=1):
+    """Whether node shard_index of shard_count handles the idx-th resume."""
+    return (idx - 1) // SHARD_SPAN % shard_count == shard_index
+
+def owns_stem(stem, shard_index=0, shard_count=1):
+    """owns() for a file stem; names that are not resume stems belong to node 0."""
+    parsed = parse_stem(stem)
+    return owns(parsed[0], shard_index, shard_count) if parsed else shard_index == 0
+
+def owned_ranges(n, shard_index=0, shard_count=1):
+    """Yield the (first, last + 1) resume index ranges of the first n that a node handles."""
+    check_partition(shard_index, shard_count)
+    for shard in range(shard_index, -(-n // SHARD_SPAN), shard_count):
+        yield shard * SHARD_SPAN + 1, min((shard + 1) * SHARD_SPAN, n) + 1
+
+def add_partition_arguments(parser):
+    """Add the --shard-index/--shard-count options every stage takes."""
+    parser.add_argument("--shard-index", type=int, default=0,
+                        help="this node's number when splitting the dataset across nodes (0-based)")
+    parser.add_argument("--shard-count", type=int, default=1,
+                        help="number of nodes splitting the dataset (see merge_nodes.py)")
+
+def iter_files(base_dir, suffix):
+    """Yield every file ending in suffix in base_dir and its shard subdirectories.
+
+    suffix may be a tuple of suffixes, e.g. IMAGE_SUFFIXES.
+
+    Uses os.scandir (no per-file stat) and yields shard by shard in name
+    order, so memory stays flat however many files there are.
+    """
+    base_dir = Path(base_dir)
+    if not base_dir.is_dir():
+        return
+    with os.scandir(base_dir) as entries:
+        entries = sorted(entries, key=lambda e: e.name)
+    for entry in entries:
+        if entry.name.isdigit() and entry.is_dir():
+            with os.scandir(entry.path) as shard:
+                names = sorted(e.name for e in shard if e.name.endswith(suffix))
+            for name in names:
+                yield Path(entry.path) / name
+        elif entry.name.endswith(suffix) and entry.is_file():
+            yield Path(entry.path)
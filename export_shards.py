@@ -0,0 +1,329 @@
+"""
+Pack the dataset into large tar shards for training (WebDataset layout).
+
+Reading millions of small PNG/TXT files is dominated by open() and stat()
+calls. This export packs each resume's clean image, noisy image, YOLO label
+and source JSON record into sequential tar shards that a loader can stream
+at disk bandwidth. Members of one sample share a key (the resume stem), as
+WebDataset expects:
+
+    resume_0000042_t07.clean.png
+    resume_0000042_t07.noisy.png
+    resume_0000042_t07.noisy.txt      rotated label of the noisy image, if written
+    resume_0000042_t07.noisy_v1.png   further noisy variants (add_noise.py --variants)
+    resume_0000042_t07.noisy_v1.txt
+    resume_0000042_t07.txt
+    resume_0000042_t07.json
+
+Layout:
+    output/shards/index.json                  splits, shards and sample counts
+    output/shards/train-000000.tar
+    output/shards/train-000000.index.json     byte offset and size per member
+    output/shards/val-000000.tar
+    ...
+
+The train/val split is the same seeded, stratified split as
+split_yolo_dataset.py. Within a split, samples are written in resume order
+(loaders shuffle shards and buffer samples anyway), so the source records
+are read in one sequential pass over data/resumes. The per-shard indexes
+allow random access with read_sample().
+"""
+import argparse
+import bisect
+import io
+import itertools
+import json
+import tarfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+
+from create_annotations import extract_template_id, load_page_templates
+from dataset_paths import (
+    ANNOT_DIR, CLEAN_DIR, IMAGE_SUFFIXES, NOISY_ANNOT_DIR, NOISY_DIR, PDF_DIR, find_image, find_variants, item_path,
+    iter_files, parse_stem
+)
+from metrics import StageMetrics
+from resume_store import DATA_DIR, count_resumes, iter_indexed_resumes
+from split_yolo_dataset import SPLIT_SEED, TRAIN_FRACTION, stratified_split
+
+EXPORT_DIR = Path("output/shards")
+INDEX_NAME = "index.json"
+SHARD_INDEX_SUFFIX = ".index.json"
+
+SAMPLES_PER_SHARD = 256  # ~0.5-1 GB per shard with 300 DPI clean + noisy pages
+READ_CHUNK = 64          # samples read ahead in parallel while the shard is written
+MAX_WORKERS = 16         # reading is I/O-bound
+READ_BUFFER = 1 << 20    # bytes; large buffered reads when streaming a shard
+
+def shard_name(split, shard_no):
+    return f"{split}-{shard_no:06d}.tar"
+
+def read_members(stem, include_noisy=True, clean_dir=CLEAN_DIR, noisy_dir=NOISY_DIR, annot_dir=ANNOT_DIR,
+                 noisy_annot_dir=NOISY_ANNOT_DIR):
+    """{extension: bytes} for one sample's files; the noisy images are optional.
+
+    Image members keep their format's extension, e.g. clean.png or noisy.webp.
+    Noisy variant k > 0 is stored as noisy_v<k>, each with its rotated label
+    when one exists.
+    """
+    clean = find_image(clean_dir, stem)
+    members = {
+        f"clean{clean.suffix}": clean.read_bytes(),
+        "txt": item_path(annot_dir, stem, ".txt").read_bytes()
+    }
+    for variant, noisy in enumerate(find_variants(noisy_dir, stem) if include_noisy else []):
+        name = "noisy" if variant == 0 else f"noisy_v{variant}"
+        members[f"{name}{noisy.suffix}"] = noisy.read_bytes()
+        label = item_path(noisy_annot_dir, noisy.stem, ".txt")
+        if label.exists():
+            members[f"{name}.txt"] = label.read_bytes()
+    return members
+
+class ShardWriter:
+    """Append samples to <split>-NNNNNN.tar files of samples_per_shard samples each."""
+
+    def __init__(self, out_dir, split, samples_per_shard=SAMPLES_PER_SHARD):
+        self.out_dir = out_dir
+        self.split = split
+        self.samples_per_shard = samples_per_shard
+        self.shards = []  # {"file", "start", "count"} per finished shard
+        self.total = 0
+        self.bytes_written = 0
+        self._tar = None
+        self._samples = []
+
+    def write(self, key, members):
+        """Add one sample; members maps extension -> bytes."""
+        if self._tar is None:
+            self._open()
+        entry = {"key": key, "members": {}}
+        for ext, data in members.items():
+            info = tarfile.TarInfo(f"{key}.{ext}")
+            info.size = len(data)
+            info.mode = 0o644  # mtime stays 0 so identical inputs give identical shards
+            self._tar.addfile(info, io.BytesIO(data))
+            # addfile leaves tar.offset just past the data, padded to a whole block
+            padded = (len(data) + tarfile.BLOCKSIZE - 1) // tarfile.BLOCKSIZE * tarfile.BLOCKSIZE
+            data_offset = self._tar.offset - padded
+            entry["members"][ext] = [data_offset, len(data)]
+        self._samples.append(entry)
+        self.total += 1
+        if len(self._samples) == self.samples_per_shard:
+            self._close()
+
+    def close(self):
+        if self._tar is not None:
+            self._close()
+
+    def _open(self):
+        name = shard_name(self.split, len(self.shards))
+        self._tar = tarfile.open(self.out_dir / f"{name}.tmp", "w", format=tarfile.USTAR_FORMAT)
+
+    def _close(self):
+        name = shard_name(self.split, len(self.shards))
+        tmp_path = self.out_dir / f"{name}.tmp"
+        self._tar.close()
+        self._tar = None
+        tmp_path.replace(self.out_dir / name)
+        self.bytes_written += (self.out_dir / name).stat().st_size
+
+        with open(self.out_dir / f"{name[:-len('.tar')]}{SHARD_INDEX_SUFFIX}", "w", encoding="utf-8") as f:
+            json.dump({"shard": name, "samples": self._samples}, f, separators=(",", ":"))
+        self.shards.append({"file": name, "start": self.total - len(self._samples), "count": len(self._samples)})
+        self._samples = []
+
+def _clear_export(out_dir):
+    for pattern in ("*.tar", "*.tar.tmp", f"*{SHARD_INDEX_SUFFIX}", INDEX_NAME):
+        for path in out_dir.glob(pattern):
+            path.unlink()
+
+def match_records(stems, records):
+    """Yield (stem, record or None) for every stem, in index order.
+
+    stems maps dataset index to stem; records are (idx, record) pairs in
+    index order. Records without an image are skipped and images without a
+    record get None.
+    """
+    ordered = sorted(stems)
+    pos = 0
+    for idx, record in records:
+        while pos < len(ordered) and ordered[pos] < idx:
+            yield stems[ordered[pos]], None
+            pos += 1
+        if pos < len(ordered) and ordered[pos] == idx:
+            yield stems[idx], record
+            pos += 1
+    for idx in ordered[pos:]:
+        yield stems[idx], None
+
+def export_shards(out_dir=EXPORT_DIR, samples_per_shard=SAMPLES_PER_SHARD, seed=SPLIT_SEED,
+                  train_fraction=TRAIN_FRACTION, include_noisy=True, workers=MAX_WORKERS, data_dir=DATA_DIR,
+                  clean_dir=CLEAN_DIR, noisy_dir=NOISY_DIR, annot_dir=ANNOT_DIR, noisy_annot_dir=NOISY_ANNOT_DIR,
+                  pdf_dir=PDF_DIR):
+    """Rebuild the tar shards in out_dir from the images, labels and resume records.
+
+    pdf_dir holds the batch page indexes that map images to templates.
+    Returns {split: sample_count}.
+    """
+    out_dir = Path(out_dir)
+    stems = {}
+    for path in iter_files(clean_dir, IMAGE_SUFFIXES):
+        parsed = parse_stem(path.stem)
+        if parsed is not None:
+            stems[parsed[0]] = path.stem
+    if not stems:
+        print("No clean images found.")
+        return {}
+
+    missing = [s for s in stems.values() if not item_path(annot_dir, s, ".txt").exists()]
+    if missing:
+        raise FileNotFoundError(f"Missing label for {len(missing)} images, e.g. {missing[0]}")
+
+    page_templates = load_page_templates(pdf_dir)
+
+    def template_of(stem):
+        return page_templates.get(stem) or extract_template_id(stem)
+
+    train, val = stratified_split(stems.values(), template_of, train_fraction, seed)
+    split_of = {**dict.fromkeys(train, "train"), **dict.fromkeys(val, "val")}
+
+    # Source records are matched to images by their dataset index
+    has_records = count_resumes(data_dir) > 0
+    if has_records:
+        records = match_records(stems, iter_indexed_resumes(data_dir))
+    else:
+        print(f"⚠️  No resume records in {data_dir}; exporting without .json members")
+        records = ((stems[idx], None) for idx in sorted(stems))
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    _clear_export(out_dir)
+    writers = {split: ShardWriter(out_dir, split, samples_per_shard) for split in ("train", "val")}
+    metrics = StageMetrics("export", total=len(stems), workers=workers)
+    print(f"Packing {len(stems)} samples into {out_dir} ({samples_per_shard} per shard)...")
+    without_record = 0
+    dirs = (clean_dir, noisy_dir, annot_dir, noisy_annot_dir)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while True:
+            chunk = list(itertools.islice(records, READ_CHUNK))
+            if not chunk:
+                break
+            start = time.perf_counter()
+            read = pool.map(lambda item: read_members(item[0], include_noisy, *dirs), chunk)
+            for (stem, record), members in zip(chunk, read):
+                if record is not None:
+                    members["json"] = json.dumps(record, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+                else:
+                    without_record += 1
+                writers[split_of[stem]].write(stem, members)
+            metrics.record(time.perf_counter() - start, len(chunk))
+
+    for writer in writers.values():
+        writer.close()
+        metrics.add_bytes(writer.bytes_written)
+
+    index = {
+        "format": "webdataset-tar",
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "seed": seed,
+        "train_fraction": train_fraction,
+        "samples_per_shard": samples_per_shard,
+        "splits": {
+            split: {"total": writer.total, "shards": writer.shards}
+            for split, writer in writers.items()
+        }
+    }
+    # Write the index last so a crashed export never looks complete
+    index_path = out_dir / INDEX_NAME
+    tmp_path = index_path.with_suffix(".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=2)
+    tmp_path.replace(index_path)
+
+    summary = metrics.save()
+    counts = {split: writer.total for split, writer in writers.items()}
+    print(f"\n✓ Export Complete!")
+    for split, writer in writers.items():
+        print(f"  {split}: {writer.total} samples in {len(writer.shards)} shards")
+    print(f"  Size: {summary['bytes_written'] / 1024**2:.1f} MB")
+    if has_records and without_record:
+        print(f"⚠️  {without_record} samples have no resume record in {data_dir}; exported without .json members")
+    return counts
+
+# -------------------------------
+# READING
+# -------------------------------
+
+def load_export_index(out_dir=EXPORT_DIR):
+    """Return the export index, or None if out_dir holds no finished export."""
+    index_path = Path(out_dir) / INDEX_NAME
+    if not index_path.exists():
+        return None
+    with open(index_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def iter_shard(shard_path):
+    """Yield (key, {extension: bytes}) for every sample in one shard, reading it sequentially."""
+    key, members = None, {}
+    with open(shard_path, "rb", buffering=READ_BUFFER) as f, tarfile.open(fileobj=f, mode="r|") as tar:
+        for info in tar:
+            name_key, ext = info.name.split(".", 1)
+            if name_key != key:
+                if key is not None:
+                    yield key, members
+                key, members = name_key, {}
+            members[ext] = tar.extractfile(info).read()
+    if key is not None:
+        yield key, members
+
+def iter_split(split="train", out_dir=EXPORT_DIR):
+    """Yield every sample of a split, shard by shard."""
+    index = load_export_index(out_dir)
+    if index is None:
+        raise FileNotFoundError(f"No export index in {out_dir}")
+    for shard in index["splits"][split]["shards"]:
+        yield from iter_shard(Path(out_dir) / shard["file"])
+
+@lru_cache(maxsize=64)
+def _shard_index(shard_path):
+    with open(shard_path[:-len(".tar")] + SHARD_INDEX_SUFFIX, "r", encoding="utf-8") as f:
+        return json.load(f)["samples"]
+
+def read_sample(n, split="train", out_dir=EXPORT_DIR, index=None):
+    """Random access: (key, {extension: bytes}) for the n-th sample (0-based) of a split."""
+    index = index or load_export_index(out_dir)
+    shards = index["splits"][split]["shards"]
+    pos = bisect.bisect_right([s["start"] for s in shards], n) - 1
+    if not 0 <= n < index["splits"][split]["total"] or pos < 0:
+        raise IndexError(f"{split} sample {n} out of range")
+    shard_path = str(Path(out_dir) / shards[pos]["file"])
+    entry = _shard_index(shard_path)[n - shards[pos]["start"]]
+
+    members = {}
+    with open(shard_path, "rb") as f:
+        for ext, (offset, size) in entry["members"].items():
+            f.seek(offset)
+            members[ext] = f.read(size)
+    return entry["key"], members
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pack images, labels and records into tar shards for training.")
+    parser.add_argument("--out", type=Path, default=EXPORT_DIR)
+    parser.add_argument("--samples-per-shard", type=int, default=SAMPLES_PER_SHARD)
+    parser.add_argument("--seed", type=int, default=SPLIT_SEED)
+    parser.add_argument("--train-fraction", type=float, default=TRAIN_FRACTION)
+    parser.add_argument("--no-noisy", action="store_true",
+                        help="only pack the clean images")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS,
+                        help="threads reading input files")
+    args = parser.parse_args()
+    export_shards(
+        out_dir=args.out,
+        samples_per_shard=args.samples_per_shard,
+        seed=args.seed,
+        train_fraction=args.train_fraction,
+        include_noisy=not args.no_noisy,
+        workers=args.workers
+    )
@@ -1,42 +1,33 @@
 """
-Fix HTML files by inlining CSS to work with wkhtmltopdf
-"""
-from pathlib import Path
-import re
+Fix HTML files by inlining CSS to work with wkhtmltopdf.
 
-HTML_DIR = Path("output/html")
-TEMPLATES_DIR = Path("templates")
+batch_render.py now emits HTML with CSS already inlined; this script is
+only needed for HTML rendered by older versions that still link style.css.
+"""
+from dataset_paths import HTML_DIR, iter_files
+from template_cache import CSS_LINK_TAG, inline_css, load_css
+from html_to_pdf import extract_template_id
 
-def fix_html_files():
-    """Inline CSS in all HTML files to fix PDF conversion issues"""
-    html_files = list(HTML_DIR.glob("*.html"))
+def fix_html_files(html_dir=HTML_DIR):
+    """Inline CSS in all HTML files in html_dir to fix PDF conversion issues"""
+    html_files = list(iter_files(html_dir, ".html"))
     
     print(f"Fixing {len(html_files)} HTML files...")
     fixed = 0
     
     for html_file in html_files:
-        # Extract template ID from filename
-        match = re.search(r'_t(\d{2})\.html', html_file.name)
-        template_id = match.group(1) if match else "01"
-        
         # Read HTML
         with open(html_file, "r", encoding="utf-8") as f:
             html_content = f.read()
         
         # Only fix if not already fixed
-        if '<link rel="stylesheet" href="style.css">' in html_content:
-            # Load CSS
-            css_path = TEMPLATES_DIR / f"template_{template_id}" / "style.css"
+        if CSS_LINK_TAG in html_content:
+            # Load CSS (cached per template)
+            css_content = load_css(extract_template_id(html_file.name))
             
-            if css_path.exists():
-                with open(css_path, "r", encoding="utf-8") as f:
-                    css_content = f.read()
-                
+            if css_content is not None:
                 # Replace link with inline style
-                html_content = html_content.replace(
-                    '<link rel="stylesheet" href="style.css">',
-                    f'<style>\n{css_content}\n    </style>'
-                )
+                html_content = inline_css(html_content, css_content)
                 
                 # Write back
                 with open(html_file, "w", encoding="utf-8") as f:
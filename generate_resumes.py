@@ -1,9 +1,21 @@
+import argparse
+import gc
+import itertools
 import json
+from pathlib import Path
 import random
-import uuid
+import string
+import time
 
-# Set seed for reproducibility
-random.seed(42)
+import numpy as np
+
+from dataset_paths import SHARD_SPAN, add_partition_arguments, owned_ranges
+from metrics import StageMetrics
+from resume_store import DATA_DIR, SHARD_SIZE, load_index, shard_dir, write_indexed_shards
+
+# Every record is derived from (SEED, record index) alone, so any subset of
+# the dataset can be generated on its own and matches a full run
+SEED = 42
 
 # -------------------------------
 # DATA POOLS
@@ -157,12 +169,17 @@ def fill_template(text, **kwargs):
         text = text.replace(f"{{{key}}}", str(value))
     return text
 
-def generate_resume():
-    name = random.choice(NAMES)
+def record_random(idx, seed=SEED):
+    """random.Random for the idx-th record, seeded from (seed, idx) only."""
+    return random.Random(f"{seed}:{idx}")
+
+def generate_resume(rng=random):
+    """One resume drawn from rng (e.g. record_random(idx)); the global random by default."""
+    name = rng.choice(NAMES)
     first_name = name.split()[0].lower()
     last_name = name.split()[1].lower()
-    email = f"{first_name}.{last_name}@{random.choice(EMAIL_DOMAINS)}"
-    phone = f"+91-{random.randint(7000000000, 9999999999)}"
+    email = f"{first_name}.{last_name}@{rng.choice(EMAIL_DOMAINS)}"
+    phone = f"+91-{rng.randint(7000000000, 9999999999)}"
     
     # LinkedIn and GitHub
     linkedin = f"linkedin.com/in/{first_name}-{last_name}"
@@ -171,36 +188,36 @@ def generate_resume():
     resume = {
         "personal_info": {
             "name": name,
-            "job_title": random.choice(JOB_TITLES),
+            "job_title": rng.choice(JOB_TITLES),
             "email": email,
             "phone": phone,
             "linkedin": linkedin,
             "github": github
         },
-        "summary": random.choice(SUMMARIES),
+        "summary": rng.choice(SUMMARIES),
         "education": [
             {
-                "degree": random.choice(DEGREES)[0],
-                "field": random.choice(DEGREES)[1],
-                "institution": random.choice(INSTITUTIONS),
+                "degree": rng.choice(DEGREES)[0],
+                "field": rng.choice(DEGREES)[1],
+                "institution": rng.choice(INSTITUTIONS),
                 "start_year": "2021",
                 "end_year": "2025"
             }
         ],
         "skills": {
-            "programming": random.sample(PROGRAMMING_SKILLS, random.randint(3, 4)),
-            "ml_dl": random.sample(ML_DL_SKILLS, random.randint(4, 6)),
-            "cv": random.sample(CV_SKILLS, random.randint(3, 4)),
-            "tools": random.sample(TOOLS, random.randint(4, 6))
+            "programming": rng.sample(PROGRAMMING_SKILLS, rng.randint(3, 4)),
+            "ml_dl": rng.sample(ML_DL_SKILLS, rng.randint(4, 6)),
+            "cv": rng.sample(CV_SKILLS, rng.randint(3, 4)),
+            "tools": rng.sample(TOOLS, rng.randint(4, 6))
         },
         "projects": [],
         "experience": [],
-        "hobbies": random.sample(HOBBIES, random.randint(2, 3))
+        "hobbies": rng.sample(HOBBIES, rng.randint(2, 3))
     }
 
     # Add 2-3 projects with detailed bullets
-    num_projects = random.randint(2, 3)
-    selected_projects = random.sample(PROJECTS, num_projects)
+    num_projects = rng.randint(2, 3)
+    selected_projects = rng.sample(PROJECTS, num_projects)
     
     for project_template in selected_projects:
         project = {
@@ -212,37 +229,37 @@ def generate_resume():
         for bullet_template in project_template["bullets"]:
             bullet = fill_template(
                 bullet_template,
-                acc=random.randint(88, 96),
-                data=random.randint(5, 15),
-                imp=random.randint(15, 30),
-                ms=random.randint(50, 200),
-                fps=random.randint(25, 60),
-                classes=random.randint(5, 10),
-                map=random.randint(75, 90),
-                iou=random.randint(82, 94),
-                red=random.randint(30, 50),
-                perf=random.randint(10, 50),
-                team=random.randint(3, 8),
-                time=random.randint(20, 40)
+                acc=rng.randint(88, 96),
+                data=rng.randint(5, 15),
+                imp=rng.randint(15, 30),
+                ms=rng.randint(50, 200),
+                fps=rng.randint(25, 60),
+                classes=rng.randint(5, 10),
+                map=rng.randint(75, 90),
+                iou=rng.randint(82, 94),
+                red=rng.randint(30, 50),
+                perf=rng.randint(10, 50),
+                team=rng.randint(3, 8),
+                time=rng.randint(20, 40)
             )
             project["description"].append(bullet)
         
         resume["projects"].append(project)
 
     # Add experience (70% chance)
-    if random.random() > 0.3:
+    if rng.random() > 0.3:
         exp_bullets = []
-        num_bullets = random.randint(3, 4)
+        num_bullets = rng.randint(3, 4)
         
-        for bullet_template in random.sample(EXPERIENCE_BULLETS, num_bullets):
+        for bullet_template in rng.sample(EXPERIENCE_BULLETS, num_bullets):
             bullet = fill_template(
                 bullet_template,
-                acc=random.randint(88, 95),
-                imp=random.randint(12, 25),
-                red=random.randint(25, 45),
-                perf=random.randint(15, 50),
-                team=random.randint(3, 7),
-                time=random.randint(25, 40)
+                acc=rng.randint(88, 95),
+                imp=rng.randint(12, 25),
+                red=rng.randint(25, 45),
+                perf=rng.randint(15, 50),
+                team=rng.randint(3, 7),
+                time=rng.randint(25, 40)
             )
             exp_bullets.append(bullet)
         
@@ -252,22 +269,269 @@ def generate_resume():
 
     return resume
 
+# -------------------------------
+# VECTORIZED BATCH GENERATOR
+# -------------------------------
+
+# Records are generated in chunks so the per-chunk NumPy draws stay small.
+# Chunks line up with the output shard directories, which are the unit of
+# work when nodes split a dataset.
+BATCH_CHUNK_SIZE = SHARD_SPAN
+
+# Metric ranges (inclusive) used when filling bullets, as in generate_resume()
+PROJECT_METRICS = {
+    "acc": (88, 96), "data": (5, 15), "imp": (15, 30), "ms": (50, 200),
+    "fps": (25, 60), "classes": (5, 10), "map": (75, 90), "iou": (82, 94),
+    "red": (30, 50), "perf": (10, 50), "team": (3, 8), "time": (20, 40)
+}
+EXPERIENCE_METRICS = {
+    "acc": (88, 95), "imp": (12, 25), "red": (25, 45),
+    "perf": (15, 50), "team": (3, 7), "time": (25, 40)
+}
+
+def compile_bullet(template, ranges):
+    """Precompile a bullet template into every string it can produce.
+
+    Bullets use at most two small-ranged metrics, so the table stays small and
+    drawing one uniform table index is the same as drawing each metric.
+    """
+    fields = [f for _, f, _, _ in string.Formatter().parse(template) if f]
+    values = [range(ranges[f][0], ranges[f][1] + 1) for f in fields]
+    return [template.format(**dict(zip(fields, combo))) for combo in itertools.product(*values)]
+
+def _bullet_tables(bullet_lists, ranges):
+    """Flatten compiled bullets into one table plus per-bullet offset/size arrays."""
+    table, offsets, sizes = [], [], []
+    for bullets in bullet_lists:
+        row_offsets, row_sizes = [], []
+        for template in bullets:
+            compiled = compile_bullet(template, ranges)
+            row_offsets.append(len(table))
+            row_sizes.append(len(compiled))
+            table.extend(compiled)
+        offsets.append(row_offsets)
+        sizes.append(row_sizes)
+    return np.array(table, dtype=object), np.array(offsets), np.array(sizes)
+
+PROJECT_BULLETS, PROJECT_BULLET_OFFSETS, PROJECT_BULLET_SIZES = _bullet_tables(
+    [p["bullets"] for p in PROJECTS], PROJECT_METRICS
+)
+EXPERIENCE_TABLE, EXPERIENCE_OFFSETS, EXPERIENCE_SIZES = _bullet_tables(
+    [EXPERIENCE_BULLETS], EXPERIENCE_METRICS
+)
+EXPERIENCE_OFFSETS, EXPERIENCE_SIZES = EXPERIENCE_OFFSETS[0], EXPERIENCE_SIZES[0]
+PROJECT_TITLES = np.array([p["title"] for p in PROJECTS], dtype=object)
+NAME_PARTS = [(name, *name.lower().split()[:2]) for name in NAMES]
+
+def _sample_rows(rng, n, pool_size, low, high):
+    """Draw a random sample of low..high distinct pool indexes for each of n rows.
+
+    Returns (order, counts): row i's sample is order[i, :counts[i]].
+    """
+    order = np.argsort(rng.random((n, pool_size)), axis=1)[:, :high]
+    counts = rng.integers(low, high + 1, n)
+    return order, counts
+
+def _pick_bullets(rng, chosen, offsets, sizes):
+    """Draw one compiled-bullet table index per chosen bullet template."""
+    sizes = sizes[chosen]
+    return offsets[chosen] + (rng.random(sizes.shape) * sizes).astype(np.int64)
+
+def _generate_chunk(rng, n, count=None):
+    """Draw every random choice for n records up front; build the first count."""
+    name_idx = rng.integers(0, len(NAMES), n).tolist()
+    domain_idx = rng.integers(0, len(EMAIL_DOMAINS), n).tolist()
+    phones = rng.integers(7000000000, 9999999999, n, endpoint=True).tolist()
+    job_idx = rng.integers(0, len(JOB_TITLES), n).tolist()
+    summary_idx = rng.integers(0, len(SUMMARIES), n).tolist()
+    degree_idx = rng.integers(0, len(DEGREES), n).tolist()
+    field_idx = rng.integers(0, len(DEGREES), n).tolist()
+    institution_idx = rng.integers(0, len(INSTITUTIONS), n).tolist()
+
+    skills = []
+    for category, pool, low, high in (
+        ("programming", PROGRAMMING_SKILLS, 3, 4),
+        ("ml_dl", ML_DL_SKILLS, 4, 6),
+        ("cv", CV_SKILLS, 3, 4),
+        ("tools", TOOLS, 4, 6)
+    ):
+        order, counts = _sample_rows(rng, n, len(pool), low, high)
+        skills.append((category, np.array(pool, dtype=object)[order].tolist(), counts.tolist()))
+    hobby_order, hobby_counts = _sample_rows(rng, n, len(HOBBIES), 2, 3)
+    hobbies = np.array(HOBBIES, dtype=object)[hobby_order].tolist()
+    hobby_counts = hobby_counts.tolist()
+
+    # Strings are looked up with NumPy fancy indexing, so each record only
+    # slices ready-made lists
+    project_order, project_counts = _sample_rows(rng, n, len(PROJECTS), 2, 3)
+    project_bullets = PROJECT_BULLETS[
+        _pick_bullets(rng, project_order, PROJECT_BULLET_OFFSETS, PROJECT_BULLET_SIZES)
+    ].tolist()
+    project_titles = PROJECT_TITLES[project_order].tolist()
+    project_counts = project_counts.tolist()
+
+    has_experience = (rng.random(n) > 0.3).tolist()
+    exp_order, exp_counts = _sample_rows(rng, n, len(EXPERIENCE_BULLETS), 3, 4)
+    exp_bullets = EXPERIENCE_TABLE[
+        _pick_bullets(rng, exp_order, EXPERIENCE_OFFSETS, EXPERIENCE_SIZES)
+    ].tolist()
+    exp_counts = exp_counts.tolist()
+
+    resumes = []
+    for i in range(n if count is None else count):
+        name, first_name, last_name = NAME_PARTS[name_idx[i]]
+
+        projects = [
+            {"title": title, "description": bullets}
+            for title, bullets in zip(project_titles[i][:project_counts[i]], project_bullets[i])
+        ]
+
+        experience = exp_bullets[i][:exp_counts[i]] if has_experience[i] else []
+
+        resumes.append({
+            "personal_info": {
+                "name": name,
+                "job_title": JOB_TITLES[job_idx[i]],
+                "email": f"{first_name}.{last_name}@{EMAIL_DOMAINS[domain_idx[i]]}",
+                "phone": f"+91-{phones[i]}",
+                "linkedin": f"linkedin.com/in/{first_name}-{last_name}",
+                "github": f"github.com/{first_name}{last_name}"
+            },
+            "summary": SUMMARIES[summary_idx[i]],
+            "education": [
+                {
+                    "degree": DEGREES[degree_idx[i]][0],
+                    "field": DEGREES[field_idx[i]][1],
+                    "institution": INSTITUTIONS[institution_idx[i]],
+                    "start_year": "2021",
+                    "end_year": "2025"
+                }
+            ],
+            "skills": {
+                category: picked[i][:counts[i]]
+                for category, picked, counts in skills
+            },
+            "projects": projects,
+            "experience": experience,
+            "hobbies": hobbies[i][:hobby_counts[i]]
+        })
+
+    return resumes
+
+def iter_resume_batches(n, seed=SEED, shard_index=0, shard_count=1):
+    """Yield n vectorized resumes as lists of up to BATCH_CHUNK_SIZE records.
+
+    Each chunk has its own Generator seeded from (seed, chunk number) and
+    always draws a full chunk, so record i depends only on (seed, i):
+    generating more resumes later, or only one node's chunks
+    (shard_index of shard_count), leaves the records unchanged.
+    """
+    for first, stop in owned_ranges(n, shard_index, shard_count):
+        rng = np.random.default_rng([seed, (first - 1) // BATCH_CHUNK_SIZE])
+        yield _generate_chunk(rng, BATCH_CHUNK_SIZE, stop - first)
+
+def iter_resume_records(n, seed=SEED, vectorized=False, shard_index=0, shard_count=1):
+    """Yield (idx, resume) for the first n records, or for one node's part of them."""
+    if vectorized:
+        chunks = iter_resume_batches(n, seed, shard_index, shard_count)
+        for (first, stop), chunk in zip(owned_ranges(n, shard_index, shard_count), chunks):
+            yield from zip(range(first, stop), chunk)
+        return
+    for first, stop in owned_ranges(n, shard_index, shard_count):
+        for idx in range(first, stop):
+            yield idx, generate_resume(record_random(idx, seed))
+
+def generate_resumes_batch(n, seed=SEED):
+    """Generate n resumes with vectorized NumPy draws.
+
+    Produces records with the same structure and value distributions as
+    generate_resume(); the same seed always yields the same records.
+    """
+    # The records hold no reference cycles, so pause the cyclic GC while
+    # building them; otherwise it keeps rescanning the growing list
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return [resume for chunk in iter_resume_batches(n, seed) for resume in chunk]
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
 # -------------------------------
 # SAVE RESUMES
 # -------------------------------
 
-def save_resumes(n=5):
-    print(f"Generating {n} resumes...")
-    for i in range(n):
-        resume = generate_resume()
-        file_name = f"{uuid.uuid4()}.json"
-        with open(f"data/resumes/{file_name}", "w") as f:
+def _timed_items(items, metrics):
+    """Yield items, recording the time between consecutive items in metrics."""
+    last = time.perf_counter()
+    for item in items:
+        yield item
+        now = time.perf_counter()
+        metrics.record(now - last)
+        last = now
+
+def save_resumes(n=5, vectorized=False, sharded=False, shard_size=SHARD_SIZE, compress=False,
+                 seed=SEED, shard_index=0, shard_count=1, data_dir=DATA_DIR):
+    """Generate n resumes into data_dir (data/resumes/).
+
+    By default each resume is its own <index>.json file (0000042.json). With
+    sharded=True they are streamed into compact JSONL shards (see
+    resume_store). With shard_count > 1 only node shard_index's part of the
+    dataset is written (see dataset_paths.owns()).
+    Returns (resumes written, failures); failures is always empty, as any
+    error aborts the stage.
+    """
+    records = iter_resume_records(n, seed, vectorized, shard_index, shard_count)
+    if shard_count > 1:
+        print(f"Generating node {shard_index + 1}/{shard_count}'s part of {n} resumes...")
+        n = sum(stop - first for first, stop in owned_ranges(n, shard_index, shard_count))
+    else:
+        print(f"Generating {n} resumes...")
+
+    metrics = StageMetrics("generate", total=n)
+
+    if sharded:
+        total = write_indexed_shards(_timed_items(records, metrics), data_dir, shard_size, compress)
+        shards = load_index(data_dir)["shards"]
+        metrics.add_bytes(sum((shard_dir(data_dir) / s["file"]).stat().st_size for s in shards))
+        metrics.save()
+        print(f"✓ All {total} resumes written to {shard_dir(data_dir)} in {len(shards)} shards!")
+        return total, []
+
+    data_dir = Path(data_dir)
+    data_dir.mkdir(parents=True, exist_ok=True)
+    last = time.perf_counter()
+    for idx, resume in records:
+        file_path = data_dir / f"{idx:07d}.json"
+        with open(file_path, "w") as f:
             json.dump(resume, f, indent=4)
-        
-        if (i + 1) % 100 == 0:
-            print(f"  Generated {i + 1}/{n} resumes...")
-    
+
+        now = time.perf_counter()
+        metrics.record(now - last, bytes_written=file_path.stat().st_size)
+        last = now
+
+    metrics.save()
     print(f"✓ All {n} resumes generated successfully!")
+    return n, []
 
 if __name__ == "__main__":
-    save_resumes(1000)
+    parser = argparse.ArgumentParser(description="Generate synthetic resume records.")
+    parser.add_argument("--count", type=int, default=1000)
+    parser.add_argument("--vectorized", action="store_true",
+                        help="NumPy batch generator for large runs")
+    parser.add_argument("--jsonl", action="store_true",
+                        help="write JSONL shards instead of one file per resume")
+    parser.add_argument("--compress", action="store_true",
+                        help="gzip the JSONL shards")
+    parser.add_argument("--seed", type=int, default=SEED)
+    add_partition_arguments(parser)
+    args = parser.parse_args()
+    save_resumes(
+        args.count,
+        vectorized=args.vectorized,
+        sharded=args.jsonl,
+        compress=args.compress,
+        seed=args.seed,
+        shard_index=args.shard_index,
+        shard_count=args.shard_count
+    )
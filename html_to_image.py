@@ -0,0 +1,118 @@
+"""
+Direct HTML → PNG rendering with wkhtmltoimage, skipping the PDF stage.
+
+The PDF path runs wkhtmltopdf per resume, writes the PDF, then runs
+pdftoppm to parse it again and rasterize the page. For an image dataset the
+PDF is only an intermediate, so this stage pipes each resume's HTML into one
+wkhtmltoimage process that writes the page image straight to its clean image
+path: one process, no PDF written or parsed.
+
+The image covers one page of wkhtmltopdf's default A4 size at DPI dots per
+inch (2480 x 3508 at 300 DPI): the HTML is laid out at the page's width in
+CSS pixels (96 per inch) and zoomed to DPI. Unlike the PDF there are no
+print margins, so the content sits slightly differently on the page; use
+create_annotations.py --measured to fit the label boxes to it.
+"""
+import argparse
+import os
+
+from dataset_paths import (
+    CLEAN_DIR, HTML_DIR, add_partition_arguments, check_partition, iter_files, output_path, owns_stem
+)
+from html_to_pdf import read_html
+from metrics import StageMetrics
+from pdf_to_image import DPI
+from tool_runner import JOB_TIMEOUT, MAX_RETRIES, run_tool, stream_jobs
+
+WKHTMLTOIMAGE_PATH = r"C:\Program Files\wkhtmltopdf\bin\wkhtmltoimage.exe"
+
+MAX_WORKERS = os.cpu_count() or 4
+PAGE_SIZE_MM = (210, 297)  # A4, wkhtmltopdf's default page size
+CSS_DPI = 96               # CSS pixels per inch
+
+def page_pixels(dpi=DPI):
+    """(width, height) in pixels of one page at dpi."""
+    return tuple(round(mm / 25.4 * dpi) for mm in PAGE_SIZE_MM)
+
+def wkhtmltoimage_command(out_path, dpi=DPI):
+    """wkhtmltoimage command line rendering HTML from stdin to a one-page PNG."""
+    width, height = page_pixels(dpi)
+    return [
+        WKHTMLTOIMAGE_PATH,
+        "--quiet",
+        "--enable-local-file-access",
+        "--format", "png",
+        "--width", str(width),
+        "--height", str(height),
+        "--zoom", f"{dpi / CSS_DPI:.4f}",
+        "--disable-smart-width",
+        "-",
+        str(out_path.resolve())
+    ]
+
+async def convert_one(html_file, output_dir=CLEAN_DIR, dpi=DPI, timeout=JOB_TIMEOUT, retries=MAX_RETRIES):
+    """Render one HTML file to output_dir/<shard>/<stem>.png. Returns the path; raises ToolError."""
+    out_path = output_path(output_dir, html_file.stem, ".png")
+    await run_tool(wkhtmltoimage_command(out_path, dpi), read_html(html_file).encode("utf-8"), timeout, retries)
+    return out_path
+
+def convert_html_to_images(output_dir=CLEAN_DIR, dpi=DPI, workers=MAX_WORKERS, timeout=JOB_TIMEOUT,
+                           retries=MAX_RETRIES, shard_index=0, shard_count=1, html_dir=HTML_DIR):
+    """Render every HTML file in html_dir (or node shard_index's part of them) straight to a page image.
+
+    Up to `workers` wkhtmltoimage processes run at once (see tool_runner.py).
+    Returns (images written, failures).
+    """
+    check_partition(shard_index, shard_count)
+    html_files = [
+        f for f in iter_files(html_dir, ".html")
+        if not f.name.endswith(".tmp.html") and owns_stem(f.stem, shard_index, shard_count)
+    ]
+
+    if not html_files:
+        print("No HTML files found.")
+        return 0, []
+
+    width, height = page_pixels(dpi)
+    print(f"Rendering {len(html_files)} HTML files to {width}x{height} PNGs ({dpi} DPI, {workers} workers)...")
+
+    converted = 0
+    failures = []
+    metrics = StageMetrics("raster", total=len(html_files), workers=workers)
+
+    jobs = ((f, convert_one, (f, output_dir, dpi, timeout, retries)) for f in html_files)
+    for html_file, seconds, image, error in stream_jobs(jobs, workers):
+        if error is None:
+            converted += 1
+            metrics.record(seconds, bytes_written=image.stat().st_size)
+        else:
+            metrics.record(seconds, failed=True)
+            failures.append((html_file, error))
+            print(f"❌ Failed: {html_file.name} → {error}")
+
+    metrics.save()
+
+    print(f"\n✓ Direct Rendering Complete!")
+    print(f"  Images: {converted}")
+    print(f"  Failed: {len(failures)}")
+
+    return converted, failures
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render every HTML file straight to a page image.")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS,
+                        help="wkhtmltoimage processes running at once")
+    parser.add_argument("--dpi", type=int, default=DPI)
+    parser.add_argument("--timeout", type=float, default=JOB_TIMEOUT,
+                        help="seconds per document before a render is killed and retried")
+    parser.add_argument("--retries", type=int, default=MAX_RETRIES)
+    add_partition_arguments(parser)
+    args = parser.parse_args()
+    convert_html_to_images(
+        dpi=args.dpi,
+        workers=args.workers,
+        timeout=args.timeout,
+        retries=args.retries,
+        shard_index=args.shard_index,
+        shard_count=args.shard_count
+    )
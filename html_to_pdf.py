@@ -1,83 +1,241 @@
-import subprocess
+import argparse
+import itertools
+import json
+import os
 from pathlib import Path
 import re
 
-HTML_DIR = Path("output/html")
-PDF_DIR = Path("output/pdf")
-TEMPLATES_DIR = Path("templates")
+from dataset_paths import (
+    HTML_DIR, PDF_DIR, add_partition_arguments, check_partition, iter_files, output_path, owns_stem, parse_stem
+)
+from metrics import StageMetrics
+from template_cache import CSS_LINK_TAG, inline_css, load_css
+from tool_runner import ToolError, run_tool, run_tool_sync, stream_jobs
 
 WKHTMLTOPDF_PATH = r"C:\Program Files\wkhtmltopdf\bin\wkhtmltopdf.exe"
 
+# Each job is one wkhtmltopdf process awaited by tool_runner's event loop;
+# MAX_WORKERS processes run at a time.
+MAX_WORKERS = os.cpu_count() or 4
+JOB_TIMEOUT = 120  # seconds per wkhtmltopdf call
+MAX_RETRIES = 2    # extra attempts after the first failure
+
+# Batched mode: one wkhtmltopdf run renders BATCH_SIZE resumes into a single
+# multi-page PDF, amortizing process start, WebKit init and font loading.
+# Each input document starts on a new page and resumes fit on one page, so
+# page N of batch_XXXXXXX.pdf is the Nth entry of batch_XXXXXXX.index.json.
+BATCH_SIZE = 200
+INDEX_SUFFIX = ".index.json"
+
 def inline_css_in_html(html_content, template_id):
-    """Inline the CSS directly into HTML to avoid path issues"""
-    css_path = TEMPLATES_DIR / f"template_{template_id}" / "style.css"
-    
-    if css_path.exists():
-        with open(css_path, "r", encoding="utf-8") as f:
-            css_content = f.read()
-        
-        # Replace link tag with inline style
-        html_content = re.sub(
-            r'<link rel="stylesheet" href="style\.css">',
-            f'<style>{css_content}</style>',
-            html_content
-        )
-    
+    """Inline the CSS directly into HTML to avoid path issues.
+
+    Only needed for HTML rendered before batch_render inlined CSS itself.
+    """
+    return inline_css(html_content, load_css(template_id))
+
+def extract_template_id(filename):
+    """Extract template ID from filename like 'resume_0000042_t07.html' -> '07'"""
+    match = re.search(r'_t(\d{2})', filename)
+    return match.group(1) if match else "01"
+
+def read_html(html_file):
+    """Read an HTML file, inlining CSS if it still links style.css."""
+    with open(html_file, "r", encoding="utf-8") as f:
+        html_content = f.read()
+
+    if CSS_LINK_TAG in html_content:
+        html_content = inline_css_in_html(html_content, extract_template_id(html_file.name))
+
     return html_content
 
-def convert_html_to_pdf():
-    PDF_DIR.mkdir(parents=True, exist_ok=True)
+def wkhtmltopdf_command(inputs, pdf_file):
+    """wkhtmltopdf command line; an input of "-" is read from stdin."""
+    return [
+        WKHTMLTOPDF_PATH,
+        "--quiet",
+        "--enable-local-file-access",
+        *[p if p == "-" else str(Path(p).resolve()) for p in inputs],
+        str(pdf_file.resolve())
+    ]
+
+def convert_html_string(html_content, pdf_file, timeout=JOB_TIMEOUT, retries=MAX_RETRIES):
+    """Convert self-contained HTML held in memory to a PDF via stdin. Returns error or None.
+
+    Blocking; for callers outside an event loop such as the streaming pipeline.
+    """
+    try:
+        run_tool_sync(wkhtmltopdf_command(["-"], pdf_file), html_content.encode("utf-8"), timeout, retries)
+        return None
+    except ToolError as e:
+        return str(e)
+
+def pdf_path(html_file, pdf_dir=PDF_DIR):
+    return output_path(pdf_dir, html_file.stem, ".pdf")
+
+async def convert_one(html_file, timeout=JOB_TIMEOUT, retries=MAX_RETRIES, pdf_dir=PDF_DIR):
+    """Convert a single HTML file to PDF. Returns the PDF path; raises ToolError."""
+    pdf_file = pdf_path(html_file, pdf_dir)
+    command = wkhtmltopdf_command(["-"], pdf_file)
+    await run_tool(command, read_html(html_file).encode("utf-8"), timeout, retries)
+    return pdf_file
+
+def batch_index_path(pdf_file):
+    """Path of the page index written next to a batched PDF."""
+    return pdf_file.with_name(pdf_file.stem + INDEX_SUFFIX)
+
+def load_batch_index(pdf_file):
+    """Return the page entries for a batched PDF, or None for a single-resume PDF."""
+    index_path = batch_index_path(pdf_file)
+    if not index_path.exists():
+        return None
+    with open(index_path, "r", encoding="utf-8") as f:
+        return json.load(f)["pages"]
+
+def first_stem(pdf_file):
+    """Stem of the first resume in a single or batched PDF."""
+    pages = load_batch_index(pdf_file)
+    return pages[0]["stem"] if pages else pdf_file.stem
+
+def batch_pdf_path(batch_no, pdf_dir=PDF_DIR):
+    # Batches hold BATCH_SIZE resumes each, so they stay directly in pdf_dir
+    return Path(pdf_dir) / f"batch_{batch_no:07d}.pdf"
+
+def make_batches(html_files, batch_size):
+    """Split html_files into (batch_no, files) batches that never span two shard directories.
+
+    batch_no is the first resume's index, so batches and their names are the
+    same however the dataset is split across nodes.
+    """
+    batches = []
+    for _, group in itertools.groupby(html_files, key=lambda f: f.parent):
+        group = list(group)
+        for i in range(0, len(group), batch_size):
+            batch = group[i:i + batch_size]
+            parsed = parse_stem(batch[0].stem)
+            batches.append((parsed[0] if parsed else len(batches) + 1, batch))
+    return batches
 
-    html_files = list(HTML_DIR.glob("*.html"))
+async def convert_batch(batch_no, html_files, timeout=JOB_TIMEOUT, retries=MAX_RETRIES, pdf_dir=PDF_DIR):
+    """Render many HTML files into one multi-page PDF plus its page index.
+
+    Returns the PDF path; raises ToolError.
+    """
+    pdf_file = batch_pdf_path(batch_no, pdf_dir)
+    inputs = []
+    temp_files = []
+
+    try:
+        # Self-contained HTML is passed as-is; only legacy files that still
+        # link style.css need an inlined temporary copy.
+        for html_file in html_files:
+            with open(html_file, "r", encoding="utf-8") as f:
+                html_content = f.read()
+            if CSS_LINK_TAG in html_content:
+                temp_html = html_file.with_suffix(".tmp.html")
+                with open(temp_html, "w", encoding="utf-8") as f:
+                    f.write(inline_css_in_html(html_content, extract_template_id(html_file.name)))
+                temp_files.append(temp_html)
+                inputs.append(temp_html)
+            else:
+                inputs.append(html_file)
+
+        # JOB_TIMEOUT is per document, so scale it to the batch
+        await run_tool(wkhtmltopdf_command(inputs, pdf_file), None, timeout * len(html_files), retries)
+
+        index = {
+            "pdf": pdf_file.name,
+            "pages": [
+                {
+                    "page": page,
+                    "stem": html_file.stem,
+                    "template_id": extract_template_id(html_file.name)
+                }
+                for page, html_file in enumerate(html_files, start=1)
+            ]
+        }
+        with open(batch_index_path(pdf_file), "w", encoding="utf-8") as f:
+            json.dump(index, f, indent=2)
+        return pdf_file
+    finally:
+        for temp_html in temp_files:
+            if temp_html.exists():
+                temp_html.unlink()
+
+def convert_html_to_pdf(workers=MAX_WORKERS, timeout=JOB_TIMEOUT, retries=MAX_RETRIES, batch_size=None,
+                        shard_index=0, shard_count=1, html_dir=HTML_DIR, pdf_dir=PDF_DIR):
+    """Convert every HTML file in html_dir (or node shard_index's part of them) to PDF in pdf_dir.
+
+    With batch_size set, resumes are grouped into multi-page batch PDFs
+    (see BATCH_SIZE) instead of one PDF per resume. Up to `workers`
+    wkhtmltopdf processes run at once (see tool_runner.py).
+    Returns (resumes converted, failures).
+    """
+    check_partition(shard_index, shard_count)
+    Path(pdf_dir).mkdir(parents=True, exist_ok=True)
+
+    html_files = [
+        f for f in iter_files(html_dir, ".html")
+        if not f.name.endswith(".tmp.html") and owns_stem(f.stem, shard_index, shard_count)
+    ]
 
     if not html_files:
         print("No HTML files found.")
-        return
-    
+        return 0, []
+
+    if batch_size:
+        batches = make_batches(html_files, batch_size)
+        print(f"Converting {len(html_files)} HTML files in {len(batches)} batches with {workers} workers...")
+    else:
+        print(f"Converting {len(html_files)} HTML files with {workers} workers...")
+
     success_count = 0
-    fail_count = 0
-
-    for html_file in html_files:
-        # Extract template ID from filename
-        match = re.search(r'_t(\d{2})\.html', html_file.name)
-        template_id = match.group(1) if match else "01"
-        
-        # Read HTML and inline CSS
-        with open(html_file, "r", encoding="utf-8") as f:
-            html_content = f.read()
-        
-        html_content = inline_css_in_html(html_content, template_id)
-        
-        # Write to temporary file
-        temp_html = html_file.with_suffix(".tmp.html")
-        with open(temp_html, "w", encoding="utf-8") as f:
-            f.write(html_content)
-        
-        pdf_file = PDF_DIR / html_file.with_suffix(".pdf").name
-
-        command = [
-            WKHTMLTOPDF_PATH,
-            "--quiet",
-            "--enable-local-file-access",
-            str(temp_html.resolve()),
-            str(pdf_file.resolve())
-        ]
-
-        try:
-            subprocess.run(command, check=True, capture_output=True)
-            success_count += 1
-            if success_count % 100 == 0:
-                print(f"✓ Converted {success_count} PDFs...")
-        except Exception as e:
-            fail_count += 1
-        finally:
-            # Clean up temp file
-            if temp_html.exists():
-                temp_html.unlink()
-    
+    failures = []
+    metrics = StageMetrics("pdf", total=len(html_files), workers=workers)
+
+    # Jobs are keyed by the HTML files they convert
+    if batch_size:
+        jobs = (
+            (batch, convert_batch, (batch_no, batch, timeout, retries, pdf_dir))
+            for batch_no, batch in batches
+        )
+    else:
+        jobs = (([f], convert_one, (f, timeout, retries, pdf_dir)) for f in html_files)
+
+    for done, seconds, pdf_file, error in stream_jobs(jobs, workers):
+        if error is None:
+            success_count += len(done)
+            metrics.record(seconds, len(done), pdf_file.stat().st_size)
+        else:
+            metrics.record(seconds, len(done), failed=True)
+            for html_file in done:
+                failures.append((html_file, error))
+            label = f"batch of {len(done)} starting at {done[0].name}" if batch_size else done[0].name
+            print(f"❌ Failed: {label} → {error}")
+
+    metrics.save()
     print(f"\n✓ PDF Conversion Complete!")
     print(f"  Success: {success_count}")
-    print(f"  Failed: {fail_count}")
+    print(f"  Failed: {len(failures)}")
+
+    return success_count, failures
 
 if __name__ == "__main__":
-    convert_html_to_pdf()
+    parser = argparse.ArgumentParser(description="Convert every HTML file to PDF with wkhtmltopdf.")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS,
+                        help="wkhtmltopdf processes running at once")
+    parser.add_argument("--timeout", type=float, default=JOB_TIMEOUT,
+                        help="seconds per document before a render is killed and retried")
+    parser.add_argument("--retries", type=int, default=MAX_RETRIES)
+    parser.add_argument("--batch-size", type=int, default=None,
+                        help=f"resumes per multi-page PDF (e.g. {BATCH_SIZE})")
+    add_partition_arguments(parser)
+    args = parser.parse_args()
+    convert_html_to_pdf(
+        workers=args.workers,
+        timeout=args.timeout,
+        retries=args.retries,
+        batch_size=args.batch_size,
+        shard_index=args.shard_index,
+        shard_count=args.shard_count
+    )
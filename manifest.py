@@ -0,0 +1,137 @@
+"""
+Persistent per-item manifest for incremental pipeline runs.
+
+For every resume and every stage (json, html, pdf, png, noisy, label) the
+manifest stores the hash of that stage's inputs, its status and its output
+path in a SQLite database. A stage is skipped when its recorded input hash
+matches the current one, it finished successfully and its output still
+exists. Hashes are chained (each stage's input hash includes the previous
+one) and include the template files, so:
+
+- a crashed run resumes where it stopped, and
+- editing one template's CSS only redoes the resumes using that template.
+"""
+import hashlib
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+from pathlib import Path
+
+from template_cache import template_dir
+
+MANIFEST_PATH = Path("output/manifest.sqlite")
+
+STAGES = ("json", "html", "pdf", "png", "noisy", "label")
+
+COMMIT_EVERY = 100  # marks between commits; at most this many redone after a crash
+
+def digest(*parts):
+    """Stable hex digest of strings/bytes, e.g. an upstream hash plus parameters."""
+    h = hashlib.sha1()
+    for part in parts:
+        h.update(part if isinstance(part, bytes) else str(part).encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+def _hash_files(*paths):
+    return digest(*(p.read_bytes() if p.exists() else b"" for p in paths))
+
+@lru_cache(maxsize=None)
+def template_fingerprint(template_id):
+    """Hash of the files that affect a template's rendered HTML."""
+    directory = template_dir(template_id)
+    return _hash_files(directory / "resume.html", directory / "style.css")
+
+@lru_cache(maxsize=None)
+def layout_fingerprint(template_id):
+    """Hash of a template's layout_config.json (affects labels only)."""
+    return _hash_files(template_dir(template_id) / "layout_config.json")
+
+class Manifest:
+    """SQLite-backed record of each item's per-stage input hash and status.
+
+    Safe to share between threads; writes are serialized by a lock.
+    """
+
+    def __init__(self, path=MANIFEST_PATH):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._lock = threading.Lock()
+        self._pending = 0
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS items (
+                    item_id TEXT NOT NULL,
+                    stage TEXT NOT NULL,
+                    input_hash TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    output TEXT,
+                    error TEXT,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (item_id, stage)
+                )
+            """)
+            self._conn.commit()
+
+    def get(self, item_id, stage):
+        """Return (input_hash, status, output) for an item's stage, or None."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT input_hash, status, output FROM items WHERE item_id = ? AND stage = ?",
+                (item_id, stage)
+            ).fetchone()
+
+    def is_fresh(self, item_id, stage, input_hash):
+        """True if the stage finished with these inputs and its output still exists."""
+        row = self.get(item_id, stage)
+        if row is None:
+            return False
+        recorded_hash, status, output = row
+        return (
+            recorded_hash == input_hash
+            and status == "done"
+            and (output is None or Path(output).exists())
+        )
+
+    def _mark(self, item_id, stage, input_hash, status, output, error):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO items VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (item_id, stage, input_hash, status,
+                 None if output is None else str(output), error, time.time())
+            )
+            self._pending += 1
+            if self._pending >= COMMIT_EVERY:
+                self._conn.commit()
+                self._pending = 0
+
+    def mark_done(self, item_id, stage, input_hash, output=None):
+        self._mark(item_id, stage, input_hash, "done", output, None)
+
+    def mark_failed(self, item_id, stage, input_hash, error):
+        self._mark(item_id, stage, input_hash, "failed", None, error)
+
+    def summary(self):
+        """Return {stage: {status: count}}."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT stage, status, COUNT(*) FROM items GROUP BY stage, status"
+            ).fetchall()
+        counts = {}
+        for stage, status, count in rows:
+            counts.setdefault(stage, {})[status] = count
+        return counts
+
+    def close(self):
+        with self._lock:
+            self._conn.commit()
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,173 @@
+"""
+Merge the datasets built on several nodes into one, and check the result.
+
+Every stage takes --shard-index/--shard-count: node i of N only handles the
+shard directories i, i + N, i + 2N, ... (see dataset_paths.py). Record
+content and templates depend only on (seed, record index), so the nodes'
+outputs never overlap and together are exactly what one node would build.
+
+Run from the checkout that will hold the merged dataset:
+
+    python merge_nodes.py node0/ node1/ node2/ --reference single_node/
+
+Files under output/html, output/pdf, output/images and annotations are
+hardlinked (copied across filesystems) from each node; a file found on two
+nodes is an error. The JSON records are merged in index order, checked to
+be complete, and written in the nodes' store layout. The merged dataset is
+then checked with verify_dataset.py and, with --reference, compared file
+by file and record by record against a dataset built on a single node.
+Metrics, manifests and verify caches stay per node.
+"""
+import argparse
+import hashlib
+import heapq
+import itertools
+import os
+from pathlib import Path
+
+from dataset_paths import ANNOT_DIR, HTML_DIR, IMAGE_DIR, PDF_DIR
+from resume_store import DATA_DIR, iter_indexed_resumes, load_index, write_shards
+from split_yolo_dataset import LINK_MODE, place_file
+from verify_dataset import verify_dataset
+
+MERGED_DIRS = (HTML_DIR, PDF_DIR, IMAGE_DIR, ANNOT_DIR)
+
+def iter_dataset_files(root="."):
+    """Yield the path, relative to root, of every file in root's MERGED_DIRS."""
+    root = Path(root)
+    for base in MERGED_DIRS:
+        for dirpath, dirnames, filenames in os.walk(root / base):
+            dirnames.sort()
+            for name in sorted(filenames):
+                if not name.endswith(".tmp.html"):
+                    yield (Path(dirpath) / name).relative_to(root)
+
+def file_sha1(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def merge_files(node_dirs, mode=LINK_MODE):
+    """Place every node's stage outputs in the current directory. Returns (files, copied)."""
+    sources = {}
+    for node in node_dirs:
+        for rel in iter_dataset_files(node):
+            if rel in sources:
+                raise FileExistsError(f"{rel} was built by both {sources[rel]} and {node}")
+            sources[rel] = node
+
+    copied = 0
+    for rel, node in sources.items():
+        rel.parent.mkdir(parents=True, exist_ok=True)
+        rel.unlink(missing_ok=True)
+        copied += place_file(Path(node) / rel, rel, mode)
+    return len(sources), copied
+
+def _contiguous(records):
+    """Pass (idx, resume) pairs through, failing on a duplicate or missing index."""
+    expected = 1
+    for idx, resume in records:
+        if idx < expected:
+            raise ValueError(f"record {idx} was generated by more than one node")
+        if idx > expected:
+            raise ValueError(f"records {expected}..{idx - 1} are missing from every node")
+        expected += 1
+        yield idx, resume
+
+def merge_records(node_dirs, mode=LINK_MODE):
+    """Merge the nodes' JSON records into DATA_DIR in index order. Returns the record count."""
+    indexes = [load_index(Path(node) / DATA_DIR) for node in node_dirs]
+    merged = _contiguous(heapq.merge(
+        *(iter_indexed_resumes(Path(node) / DATA_DIR) for node in node_dirs),
+        key=lambda record: record[0]
+    ))
+
+    if any(index is not None for index in indexes):
+        if None in indexes:
+            raise ValueError("some nodes wrote JSONL shards and some per-file records")
+        index = indexes[0]
+        return write_shards(
+            (resume for _, resume in merged),
+            DATA_DIR,
+            shard_size=index["shard_size"],
+            compress=index["compression"] == "gzip"
+        )
+
+    # Per-file records are named by index, so they are placed like stage outputs
+    DATA_DIR.mkdir(parents=True, exist_ok=True)
+    count = 0
+    for node in node_dirs:
+        for src in Path(node, DATA_DIR).glob("*.json"):
+            dst = DATA_DIR / src.name
+            dst.unlink(missing_ok=True)
+            place_file(src, dst, mode)
+    for count, _ in _contiguous(iter_indexed_resumes(DATA_DIR)):
+        pass
+    return count
+
+def compare_with_reference(reference):
+    """List the differences between the current directory's dataset and reference's.
+
+    PDFs are compared by name only, since wkhtmltopdf stamps each one with
+    its creation time.
+    """
+    reference = Path(reference)
+    ours = set(iter_dataset_files())
+    theirs = set(iter_dataset_files(reference))
+    differences = [f"missing: {rel}" for rel in sorted(theirs - ours)]
+    differences += [f"not in reference: {rel}" for rel in sorted(ours - theirs)]
+    for rel in sorted(ours & theirs):
+        if rel.suffix != ".pdf" and file_sha1(rel) != file_sha1(reference / rel):
+            differences.append(f"differs: {rel}")
+
+    records = itertools.zip_longest(iter_indexed_resumes(DATA_DIR), iter_indexed_resumes(reference / DATA_DIR))
+    for record, expected in records:
+        if record != expected:
+            idx = (record or expected)[0]
+            differences.append(f"record {idx} differs")
+    return differences
+
+def merge_nodes(node_dirs, reference=None, mode=LINK_MODE):
+    """Merge node_dirs into the current directory, verify it and compare it with reference.
+
+    Returns True if every check passed.
+    """
+    node_dirs = [Path(node) for node in node_dirs]
+    if any(node.resolve() == Path.cwd().resolve() for node in node_dirs):
+        raise ValueError("run merge_nodes.py from a directory that is not one of the nodes")
+
+    print(f"Merging {len(node_dirs)} node datasets into {Path.cwd()}...")
+    records = merge_records(node_dirs, mode)
+    print(f"✓ JSON records: {records}")
+    files, copied = merge_files(node_dirs, mode)
+    print(f"✓ Files: {files}")
+    if copied:
+        print(f"⚠️  {copied} files were copied because {mode} is not supported here")
+
+    ok = verify_dataset()
+
+    if reference is not None:
+        differences = compare_with_reference(reference)
+        if differences:
+            print(f"\n⚠️  {len(differences)} differences from {reference}:")
+            for difference in differences[:50]:
+                print(f"   - {difference}")
+            if len(differences) > 50:
+                print(f"   ... and {len(differences) - 50} more")
+        else:
+            print(f"\n✅ Identical to the single-node dataset in {reference}")
+        ok = ok and not differences
+
+    return ok
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge node datasets into the current directory and verify them.")
+    parser.add_argument("nodes", nargs="+", help="dataset directory of each node")
+    parser.add_argument("--reference", default=None,
+                        help="single-node dataset the merged one must match")
+    parser.add_argument("--mode", choices=("hardlink", "symlink", "reflink", "copy"), default=LINK_MODE,
+                        help="how node files are placed (default: hardlink)")
+    args = parser.parse_args()
+    raise SystemExit(0 if merge_nodes(args.nodes, args.reference, args.mode) else 1)
@@ -0,0 +1,203 @@
+"""
+Per-stage performance metrics.
+
+Each stage creates a StageMetrics, records every item (or batch of items)
+it finishes and saves a summary to output/metrics/<stage>.json: items/s,
+p50/p95/p99 per-item latency, failures, bytes written and peak RSS. While
+running it prints a progress line with an ETA every PROGRESS_INTERVAL
+seconds. The pipeline runner merges the stage files into
+pipeline_metrics.json and pipeline_metrics.csv and points out the slowest
+stage.
+
+When stages run concurrently (streaming mode) they all move at the
+pipeline's pace, so each summary also has capacity_per_sec: workers
+divided by the mean per-item latency, i.e. the rate the stage could
+sustain on its own. The bottleneck is the stage with the lowest capacity.
+"""
+import array
+import csv
+import json
+import sys
+import threading
+import time
+from pathlib import Path
+
+# resource (peak RSS) is not available on Windows
+try:
+    import resource
+except ImportError:
+    resource = None
+
+METRICS_DIR = Path("output/metrics")
+REPORT_NAME = "pipeline_metrics"
+PROGRESS_INTERVAL = 5.0  # seconds between progress lines
+
+STAGE_ORDER = ("generate", "render", "pdf", "raster", "page", "noise", "annotate", "augment", "export", "memmap")
+FIELDS = (
+    "stage", "items", "failures", "seconds", "workers", "items_per_sec", "capacity_per_sec",
+    "p50_ms", "p95_ms", "p99_ms", "bytes_written", "peak_rss_mb"
+)
+
+def peak_rss_mb():
+    """Peak RSS in MB of this process and of its largest finished child process.
+
+    Returns (self_mb, children_mb), or None where resource is unavailable.
+    """
+    if resource is None:
+        return None
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    unit = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return (
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / unit,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / unit
+    )
+
+def timed(fn, *args):
+    """Call fn(*args) and return (seconds, result); picklable for process pools."""
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+def format_eta(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+class StageMetrics:
+    """Thread-safe counters and per-item latencies for one pipeline stage."""
+
+    def __init__(self, stage, total=None, workers=1, progress=True):
+        self.stage = stage
+        self.total = total
+        self.workers = workers
+        self.progress = progress
+        self.items = 0
+        self.failures = 0
+        self.bytes_written = 0
+        self.latencies = array.array("d")  # seconds per successful item
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+        self._last_report = self._start
+        self._end = None
+
+    def record(self, seconds, items=1, bytes_written=0, failed=False):
+        """Record items finished in seconds (a batch's time is split evenly)."""
+        with self._lock:
+            if failed:
+                self.failures += items
+            else:
+                self.items += items
+                self.latencies.extend([seconds / items] * items)
+            self.bytes_written += bytes_written
+            now = time.perf_counter()
+            if not self.progress or now - self._last_report < PROGRESS_INTERVAL:
+                return
+            self._last_report = now
+        print(self.progress_line(), flush=True)
+
+    def add_bytes(self, n):
+        with self._lock:
+            self.bytes_written += n
+
+    def progress_line(self):
+        elapsed = time.perf_counter() - self._start
+        done = self.items + self.failures
+        rate = done / elapsed if elapsed > 0 else 0.0
+        line = f"⏱  {self.stage}: {done}"
+        if self.total:
+            line += f"/{self.total} ({100 * done / self.total:.0f}%)"
+        line += f", {rate:.1f} items/s"
+        if self.total and rate > 0:
+            line += f", ETA {format_eta((self.total - done) / rate)}"
+        return line
+
+    def finish(self):
+        """Stop the clock; later summaries use the same elapsed time."""
+        self._end = time.perf_counter()
+
+    def summary(self):
+        """Dict with one value per FIELDS entry."""
+        elapsed = (self._end or time.perf_counter()) - self._start
+        with self._lock:
+            latencies = sorted(self.latencies)
+        busy = sum(latencies)
+
+        def percentile_ms(q):
+            if not latencies:
+                return None
+            # Nearest-rank percentile
+            return round(1000 * latencies[min(len(latencies) - 1, int(q * len(latencies)))], 3)
+
+        rss = peak_rss_mb()
+        return {
+            "stage": self.stage,
+            "items": self.items,
+            "failures": self.failures,
+            "seconds": round(elapsed, 3),
+            "workers": self.workers,
+            "items_per_sec": round(self.items / elapsed, 2) if elapsed > 0 else None,
+            "capacity_per_sec": round(self.workers * len(latencies) / busy, 2) if busy > 0 else None,
+            "p50_ms": percentile_ms(0.50),
+            "p95_ms": percentile_ms(0.95),
+            "p99_ms": percentile_ms(0.99),
+            "bytes_written": self.bytes_written,
+            "peak_rss_mb": round(max(rss), 1) if rss is not None else None
+        }
+
+    def save(self, metrics_dir=METRICS_DIR):
+        """Write the summary to <metrics_dir>/<stage>.json and return it."""
+        if self._end is None:
+            self.finish()
+        summary = self.summary()
+        metrics_dir.mkdir(parents=True, exist_ok=True)
+        with open(metrics_dir / f"{self.stage}.json", "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+        return summary
+
+def clear_stage_metrics(metrics_dir=METRICS_DIR):
+    """Remove stage files from a previous run."""
+    for stage in STAGE_ORDER:
+        (metrics_dir / f"{stage}.json").unlink(missing_ok=True)
+
+def load_stage_metrics(metrics_dir=METRICS_DIR):
+    """Stage summaries saved by this run, in pipeline order."""
+    summaries = []
+    for stage in STAGE_ORDER:
+        path = metrics_dir / f"{stage}.json"
+        if path.exists():
+            with open(path, "r", encoding="utf-8") as f:
+                summaries.append(json.load(f))
+    return summaries
+
+def write_report(summaries, metrics_dir=METRICS_DIR):
+    """Write pipeline_metrics.json and .csv; returns the JSON path."""
+    metrics_dir.mkdir(parents=True, exist_ok=True)
+    json_path = metrics_dir / f"{REPORT_NAME}.json"
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump({"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "stages": summaries}, f, indent=2)
+    with open(metrics_dir / f"{REPORT_NAME}.csv", "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        writer.writerows(summaries)
+    return json_path
+
+def print_report(summaries):
+    """Print a per-stage table and name the stage with the lowest capacity."""
+    if not summaries:
+        return
+
+    def cell(value, fmt=".1f"):
+        return "-" if value is None else format(value, fmt)
+
+    print(f"\n{'Stage':<10}{'Items':>9}{'Failed':>8}{'Items/s':>10}{'Capacity':>10}"
+          f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'MB out':>10}{'RSS MB':>9}")
+    for s in summaries:
+        print(
+            f"{s['stage']:<10}{s['items']:>9}{s['failures']:>8}"
+            f"{cell(s['items_per_sec']):>10}{cell(s['capacity_per_sec']):>10}"
+            f"{cell(s['p50_ms']):>10}{cell(s['p95_ms']):>10}{cell(s['p99_ms']):>10}"
+            f"{s['bytes_written'] / 1024**2:>10.1f}{cell(s['peak_rss_mb'], '.0f'):>9}"
+        )
+    rated = [s for s in summaries if s["capacity_per_sec"]]
+    if rated:
+        slowest = min(rated, key=lambda s: s["capacity_per_sec"])
+        print(f"\n🐢 Bottleneck: {slowest['stage']} (capacity {slowest['capacity_per_sec']:.1f} items/s)")
@@ -0,0 +1,269 @@
+"""
+Fused raster + augment + label stage: every page is decoded exactly once.
+
+The stage-by-stage pipeline has pdftoppm encode each page to PNG, moves the
+file, decodes it again in add_noise.py and opens it a third time in
+create_annotations.py --measured. This stage renders each PDF page straight
+into memory (a PyMuPDF pixmap, or pdftoppm's raw PPM stream read from a
+pipe) and writes the clean image, the noisy variant and the label from that
+one buffer, encoding each output once. With --variants K it writes K noisy
+copies per page, each with its own label rotated like the page.
+
+The output format trades CPU for disk:
+- png: zlib level selectable (--png-level; 1 is fast, 6-9 smaller)
+- webp: lossless, smaller than PNG for clean pages
+- jpeg: lossy but ~30x faster to encode than PNG for noisy pages
+
+Noisy images are identical to those add_noise.py writes for the same clean
+file (the per-image seed is taken from the clean file name).
+"""
+import argparse
+import itertools
+import os
+import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image
+
+import pdf_to_image
+from add_noise import AUGMENT_SEED, PNG_COMPRESS_LEVEL, VARIANTS, save_image, write_variants
+from create_annotations import extract_template_id, ink_label_text, label_text, load_layout, write_annotation
+from dataset_paths import (
+    ANNOT_DIR, CLEAN_DIR, IMAGE_SUFFIXES, NOISY_ANNOT_DIR, NOISY_DIR, PDF_DIR, item_path, iter_files, output_path,
+    variant_stem
+)
+from dataset_paths import add_partition_arguments, check_partition, owns_stem
+from html_to_pdf import first_stem, load_batch_index
+from measure_layout import ink_mask
+from metrics import StageMetrics, timed
+from pdf_to_image import DPI, resolve_backend
+
+OUTPUT_FORMATS = {"png": ".png", "webp": ".webp", "jpeg": ".jpg"}
+OUTPUT_FORMAT = "png"
+MAX_WORKERS = os.cpu_count() or 4
+
+def _read_ppm_header(stream):
+    """(width, height) from a binary PPM header, or None at end of stream."""
+    fields = []
+    while len(fields) < 4:
+        line = stream.readline()
+        if not line:
+            return None
+        fields += line.split()
+    magic, width, height, maxval = fields
+    if magic != b"P6" or maxval != b"255":
+        raise RuntimeError(f"unexpected pdftoppm output ({magic.decode()}, maxval {maxval.decode()})")
+    return int(width), int(height)
+
+def iter_pdftoppm_pages(pdf, dpi=DPI, last_page=None):
+    """Yield each page of pdf as an RGB image, streamed from pdftoppm's stdout.
+
+    Without an output root pdftoppm writes uncompressed PPM to stdout, so
+    there is no PNG to encode or decode and only one page is held at a time.
+    stderr goes to a temporary file, so a stream of warnings cannot fill a
+    pipe nobody reads and stall pdftoppm.
+    """
+    command = [
+        pdf_to_image.PDFTOPPM,
+        "-r", str(dpi),
+        *(["-l", str(last_page)] if last_page else []),
+        str(pdf.resolve())
+    ]
+    with tempfile.TemporaryFile() as err:
+        with subprocess.Popen(command, stdout=subprocess.PIPE, stderr=err) as proc:
+            while (size := _read_ppm_header(proc.stdout)) is not None:
+                data = proc.stdout.read(size[0] * size[1] * 3)
+                yield Image.frombytes("RGB", size, data)
+        err.seek(0)
+        stderr = err.read()
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, command, stderr=stderr)
+
+def iter_pymupdf_pages(pdf, dpi=DPI, last_page=None, page_count=None):
+    """Yield each page of pdf as an RGB image rendered in-process.
+
+    With page_count, a PDF with any other number of pages is refused before
+    a page is rendered.
+    """
+    with pdf_to_image.fitz.open(pdf) as doc:
+        if page_count is not None and doc.page_count != page_count:
+            raise RuntimeError(f"PDF has {doc.page_count} pages but {page_count} were expected")
+        for page in itertools.islice(doc, last_page):
+            pix = page.get_pixmap(dpi=dpi, alpha=False)
+            yield Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+
+def iter_pages(pdf, dpi=DPI, backend=pdf_to_image.BACKEND, last_page=None, page_count=None):
+    """Yield each page of pdf as an RGB image.
+
+    Only PyMuPDF checks page_count up front; pdftoppm streams its pages, so
+    callers count them as they arrive.
+    """
+    if resolve_backend(backend) == "pymupdf":
+        return iter_pymupdf_pages(pdf, dpi, last_page, page_count)
+    return iter_pdftoppm_pages(pdf, dpi, last_page)
+
+def render_first_page(pdf, dpi=DPI, backend=pdf_to_image.BACKEND):
+    """First page of pdf as an RGB image."""
+    pages = list(iter_pages(pdf, dpi, backend, last_page=1))
+    if not pages:
+        raise RuntimeError("no pages rendered")
+    return pages[0]
+
+def process_page(img, stem, template_id, fmt=OUTPUT_FORMAT, measured=False,
+                 seed=AUGMENT_SEED, png_level=PNG_COMPRESS_LEVEL, variants=VARIANTS, clean_dir=CLEAN_DIR,
+                 noisy_dir=NOISY_DIR, annot_dir=ANNOT_DIR, noisy_annot_dir=NOISY_ANNOT_DIR):
+    """Write the clean image and label and the noisy variants and their labels of one rendered page.
+
+    Returns the number of bytes written.
+    """
+    layout = load_layout(template_id)
+    if layout is None:
+        raise RuntimeError(f"no layout_config.json for template {template_id}")
+
+    ext = OUTPUT_FORMATS[fmt]
+    # Drop copies left in another format by an earlier run
+    for other in IMAGE_SUFFIXES:
+        if other != ext:
+            item_path(clean_dir, stem, other).unlink(missing_ok=True)
+            for variant in range(variants):
+                item_path(noisy_dir, variant_stem(stem, variant), other).unlink(missing_ok=True)
+
+    clean = output_path(clean_dir, stem, ext)
+    save_image(img, clean, png_level)
+
+    text = ink_label_text(ink_mask(img), layout) if measured else label_text(template_id)
+    label = write_annotation(stem, text, annot_dir)
+
+    written = clean.stat().st_size + label.stat().st_size
+    return written + write_variants(
+        img, stem, clean.name, text, variants, seed, ext, png_level, noisy_dir, noisy_annot_dir
+    )
+
+def remove_page_outputs(stem, variants=VARIANTS, clean_dir=CLEAN_DIR, noisy_dir=NOISY_DIR, annot_dir=ANNOT_DIR,
+                        noisy_annot_dir=NOISY_ANNOT_DIR):
+    """Delete the clean image, noisy variants and labels process_page wrote for stem."""
+    for suffix in IMAGE_SUFFIXES:
+        item_path(clean_dir, stem, suffix).unlink(missing_ok=True)
+    item_path(annot_dir, stem, ".txt").unlink(missing_ok=True)
+    for variant in range(variants):
+        noisy_stem = variant_stem(stem, variant)
+        for suffix in IMAGE_SUFFIXES:
+            item_path(noisy_dir, noisy_stem, suffix).unlink(missing_ok=True)
+        item_path(noisy_annot_dir, noisy_stem, ".txt").unlink(missing_ok=True)
+
+def process_pdf(pdf, fmt, measured, dpi, backend, seed, png_level, variants,
+                clean_dir=CLEAN_DIR, noisy_dir=NOISY_DIR, annot_dir=ANNOT_DIR, noisy_annot_dir=NOISY_ANNOT_DIR):
+    """Worker entry point: every page of one PDF (single or batched).
+
+    Returns (pdf, pages_done, bytes_written, error or None). A batched PDF
+    whose page count differs from its index is a failure as a whole: no
+    page is kept, as its pages cannot be matched to their resumes.
+    """
+    pages = load_batch_index(pdf)
+    if pages is None:
+        pages = [{"stem": pdf.stem, "template_id": extract_template_id(pdf.name)}]
+    done = 0
+    written = 0
+    try:
+        # A single-resume PDF only uses its first page, as in pdf_to_image
+        last_page = None if len(pages) > 1 else 1
+        rendered = iter_pages(pdf, dpi, backend, last_page, page_count=None if last_page else len(pages))
+        for entry, img in zip(pages, rendered):
+            written += process_page(
+                img, entry["stem"], entry["template_id"], fmt, measured, seed, png_level, variants,
+                clean_dir, noisy_dir, annot_dir, noisy_annot_dir
+            )
+            done += 1
+        # Read to the end: a page beyond the index means a resume spilled
+        # onto a second page and every later page belongs to another resume.
+        # This also lets pdftoppm finish, so its exit code is checked.
+        extra = sum(1 for _ in rendered)
+        if done != len(pages) or extra:
+            for entry in pages[:done]:
+                remove_page_outputs(entry["stem"], variants, clean_dir, noisy_dir, annot_dir, noisy_annot_dir)
+            return pdf, 0, 0, f"{done + extra} pages rendered but index lists {len(pages)} resumes"
+        return pdf, done, written, None
+    except subprocess.CalledProcessError as e:
+        stderr = e.stderr.decode("utf-8", errors="replace").strip()
+        error = f"exit code {e.returncode}" + (f": {stderr.splitlines()[-1]}" if stderr else "")
+        return pdf, done, written, error
+    except Exception as e:
+        return pdf, done, written, str(e)
+
+def run_page_stage(fmt=OUTPUT_FORMAT, measured=False, workers=MAX_WORKERS, dpi=DPI,
+                   backend=pdf_to_image.BACKEND, seed=AUGMENT_SEED, png_level=PNG_COMPRESS_LEVEL,
+                   variants=VARIANTS, shard_index=0, shard_count=1, pdf_dir=PDF_DIR, clean_dir=CLEAN_DIR,
+                   noisy_dir=NOISY_DIR, annot_dir=ANNOT_DIR, noisy_annot_dir=NOISY_ANNOT_DIR):
+    """Rasterize, augment and label every PDF in pdf_dir (or node shard_index's part) in a process pool.
+
+    Returns (pages_done, failures).
+    """
+    if fmt not in OUTPUT_FORMATS:
+        raise ValueError(f"fmt must be one of {', '.join(OUTPUT_FORMATS)}")
+    check_partition(shard_index, shard_count)
+    pdf_files = [pdf for pdf in iter_files(pdf_dir, ".pdf") if owns_stem(first_stem(pdf), shard_index, shard_count)]
+    if not pdf_files:
+        print("No PDF files found.")
+        return 0, []
+
+    backend = resolve_backend(backend)
+    resumes = {pdf: len(load_batch_index(pdf) or [pdf]) for pdf in pdf_files}
+    print(f"Rendering, augmenting and labelling {sum(resumes.values())} pages "
+          f"({fmt}, {backend}, {variants} noisy variants, {workers} workers)...")
+
+    done_total = 0
+    failures = []
+    metrics = StageMetrics("page", total=sum(resumes.values()), workers=workers)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(
+            timed, itertools.repeat(process_pdf), pdf_files, itertools.repeat(fmt),
+            itertools.repeat(measured), itertools.repeat(dpi), itertools.repeat(backend),
+            itertools.repeat(seed), itertools.repeat(png_level), itertools.repeat(variants),
+            itertools.repeat(clean_dir), itertools.repeat(noisy_dir), itertools.repeat(annot_dir),
+            itertools.repeat(noisy_annot_dir)
+        )
+        for seconds, (pdf, done, written, error) in results:
+            done_total += done
+            if done:
+                metrics.record(seconds, done, written)
+            if error is not None:
+                metrics.record(0.0, resumes[pdf] - done, failed=True)
+                failures.append((pdf, error))
+                print(f"❌ Failed: {pdf.name} → {error}")
+
+    summary = metrics.save()
+    print(f"\n✓ Page Stage Complete!")
+    print(f"  Pages: {done_total}")
+    print(f"  Failed PDFs: {len(failures)}")
+    print(f"  Throughput: {summary['items_per_sec']:.1f} pages/s")
+    return done_total, failures
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rasterize, augment and label every PDF in one pass.")
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, default=OUTPUT_FORMAT,
+                        help="encoding of the clean and noisy images")
+    parser.add_argument("--png-level", type=int, default=PNG_COMPRESS_LEVEL,
+                        help="zlib level 0-9 for PNG output")
+    parser.add_argument("--measured", action="store_true",
+                        help="fit label boxes to each page (see create_annotations.py)")
+    parser.add_argument("--variants", type=int, default=VARIANTS,
+                        help="noisy copies per page, each with its own rotated label")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS)
+    parser.add_argument("--seed", type=int, default=AUGMENT_SEED)
+    parser.add_argument("--dpi", type=int, default=DPI)
+    parser.add_argument("--backend", choices=("auto", "pymupdf", "pdftoppm"), default=pdf_to_image.BACKEND)
+    add_partition_arguments(parser)
+    args = parser.parse_args()
+    run_page_stage(
+        fmt=args.format,
+        measured=args.measured,
+        workers=args.workers,
+        dpi=args.dpi,
+        backend=args.backend,
+        seed=args.seed,
+        png_level=args.png_level,
+        variants=args.variants,
+        shard_index=args.shard_index,
+        shard_count=args.shard_count
+    )
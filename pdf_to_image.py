@@ -1,38 +1,232 @@
-import subprocess
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 
-PDF_DIR = Path("output/pdf")
-IMAGE_DIR = Path("output/images")
+from dataset_paths import (
+    IMAGE_DIR, PDF_DIR, add_partition_arguments, check_partition, iter_files, output_path, owns_stem
+)
+from html_to_pdf import first_stem, load_batch_index
+from metrics import StageMetrics, timed
+from tool_runner import JOB_TIMEOUT, MAX_RETRIES, run_tool, run_tool_sync, stream_jobs
+
+# PyMuPDF: optional in-process backend (imported as "fitz" before 1.24)
+try:
+    import pymupdf as fitz
+except ImportError:
+    try:
+        import fitz
+    except ImportError:
+        fitz = None
 
 PDFTOPPM = r"C:\poppler-25.12.0\Library\bin\pdftoppm.exe"
 
-def convert_pdf_to_images():
-    IMAGE_DIR.mkdir(parents=True, exist_ok=True)
+DPI = 300
+IMAGE_FORMAT = "png"  # later stages read PNG; jpeg/tiff are for other uses
+MAX_WORKERS = os.cpu_count() or 4
+
+# Backends: "pdftoppm" forks one poppler process per PDF, "pymupdf" renders
+# in-process with PyMuPDF, "auto" uses PyMuPDF when it is installed.
+BACKEND = "auto"
+
+# pdftoppm flag and file extension per output format
+FORMATS = {
+    "png": ("-png", ".png"),
+    "jpeg": ("-jpeg", ".jpg"),
+    "tiff": ("-tiff", ".tif")
+}
+
+def resolve_backend(backend=BACKEND):
+    """Turn "auto" into a concrete backend name."""
+    if backend == "auto":
+        return "pymupdf" if fitz is not None else "pdftoppm"
+    if backend == "pymupdf" and fitz is None:
+        raise RuntimeError("PyMuPDF is not installed (pip install pymupdf)")
+    return backend
+
+def _save_pixmap(pix, out_path, fmt):
+    if fmt == "png":
+        pix.save(str(out_path))
+        return
+    from PIL import Image
+    img = Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+    img.save(out_path, format=fmt.upper())
+
+def _render_pymupdf(pdf, out_paths, dpi, fmt, batch=False):
+    """Render pages 1..len(out_paths) of pdf in-process.
 
-    pdf_files = list(PDF_DIR.glob("*.pdf"))
+    A batched PDF must have exactly one page per output path, as
+    _place_batch_pages requires for pdftoppm; a single-resume PDF only
+    uses its first page.
+    """
+    with fitz.open(pdf) as doc:
+        if doc.page_count < len(out_paths) or (batch and doc.page_count != len(out_paths)):
+            raise RuntimeError(f"PDF has {doc.page_count} pages but {len(out_paths)} were expected")
+        for page, out_path in zip(doc, out_paths):
+            _save_pixmap(page.get_pixmap(dpi=dpi, alpha=False), out_path, fmt)
+
+def pdftoppm_command(pdf, output_prefix, dpi, fmt, first_page_only):
+    # -singlefile writes <prefix><ext> for page 1 only
+    return [
+        PDFTOPPM,
+        FORMATS[fmt][0],
+        "-r", str(dpi),
+        *(["-singlefile"] if first_page_only else []),
+        str(pdf.resolve()),
+        str(output_prefix.resolve())
+    ]
+
+def rasterize_pdf(pdf, out_path, dpi=DPI, fmt=IMAGE_FORMAT, backend=BACKEND):
+    """Render the first page of a single-resume PDF to out_path.
+
+    out_path is used exactly as given (e.g. resume_0000042_t07.png), with no
+    page-number suffix.
+    """
+    backend = resolve_backend(backend)
+    out_path = Path(out_path)
+    if backend == "pymupdf":
+        _render_pymupdf(pdf, [out_path], dpi, fmt)
+    else:
+        run_tool_sync(pdftoppm_command(pdf, out_path.with_suffix(""), dpi, fmt, first_page_only=True))
+
+def batch_output_paths(pages, output_dir, fmt=IMAGE_FORMAT):
+    """Image path (in its shard directory) for each entry of a batched PDF's page index."""
+    return [output_path(output_dir, entry["stem"], FORMATS[fmt][1]) for entry in pages]
+
+def _place_batch_pages(pdf, pages, output_dir, fmt):
+    """Move pdftoppm's <batch>-<page> images of a batched PDF to their resume paths."""
+    ext = FORMATS[fmt][1]
+    out_paths = batch_output_paths(pages, output_dir, fmt)
+    # pdftoppm zero-pads page numbers to the width of the last page number
+    page_images = sorted(
+        output_dir.glob(f"{pdf.stem}-*{ext}"),
+        key=lambda p: int(p.stem.rsplit("-", 1)[1])
+    )
+    if len(page_images) != len(pages):
+        for image in page_images:
+            image.unlink()
+        raise RuntimeError(f"{len(page_images)} pages rendered but index lists {len(pages)} resumes")
+
+    for image, out_path in zip(page_images, out_paths):
+        image.replace(out_path)
+    return out_paths
+
+def rasterize_batch(pdf, pages, output_dir, dpi=DPI, fmt=IMAGE_FORMAT, backend=BACKEND):
+    """Render every page of a batched PDF to <resume stem><ext> using its index."""
+    if resolve_backend(backend) == "pymupdf":
+        _render_pymupdf(pdf, batch_output_paths(pages, output_dir, fmt), dpi, fmt, batch=True)
+        return
+    run_tool_sync(pdftoppm_command(pdf, output_dir / pdf.stem, dpi, fmt, first_page_only=False))
+    _place_batch_pages(pdf, pages, output_dir, fmt)
+
+async def convert_one_pdftoppm(pdf, output_dir, dpi, fmt, timeout=JOB_TIMEOUT, retries=MAX_RETRIES):
+    """Rasterize one PDF (single or batched) with pdftoppm via tool_runner.
+
+    Returns the image paths; raises ToolError if pdftoppm fails.
+    """
+    pages = load_batch_index(pdf)
+    if pages is None:
+        out_path = output_path(output_dir, pdf.stem, FORMATS[fmt][1])
+        command = pdftoppm_command(pdf, out_path.with_suffix(""), dpi, fmt, first_page_only=True)
+        await run_tool(command, timeout=timeout, retries=retries)
+        return [out_path]
+    # The timeout is per page, as in html_to_pdf's batches
+    command = pdftoppm_command(pdf, output_dir / pdf.stem, dpi, fmt, first_page_only=False)
+    await run_tool(command, timeout=timeout * len(pages), retries=retries)
+    return _place_batch_pages(pdf, pages, output_dir, fmt)
+
+def convert_one(pdf, output_dir, dpi, fmt):
+    """PyMuPDF worker: rasterize one PDF (single or batched).
+
+    Returns (pdf, image paths, error or None).
+    """
+    pages = load_batch_index(pdf)
+    try:
+        if pages is not None:
+            out_paths = batch_output_paths(pages, output_dir, fmt)
+        else:
+            out_paths = [output_path(output_dir, pdf.stem, FORMATS[fmt][1])]
+        _render_pymupdf(pdf, out_paths, dpi, fmt, batch=pages is not None)
+        return pdf, out_paths, None
+    except Exception as e:
+        return pdf, [], str(e)
+
+def _pymupdf_results(pdf_files, output_dir, dpi, fmt, workers):
+    """Run convert_one in worker processes; yields (pdf, seconds, image paths, error)."""
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(timed, convert_one, pdf, output_dir, dpi, fmt) for pdf in pdf_files]
+        for future in as_completed(futures):
+            seconds, (pdf, images, error) = future.result()
+            yield pdf, seconds, images, error
+
+def convert_pdf_to_images(output_dir=IMAGE_DIR, dpi=DPI, fmt=IMAGE_FORMAT, workers=MAX_WORKERS, backend=BACKEND,
+                          timeout=JOB_TIMEOUT, retries=MAX_RETRIES, shard_index=0, shard_count=1, pdf_dir=PDF_DIR):
+    """Rasterize every PDF in pdf_dir (or node shard_index's part of them) in parallel.
+
+    Each resume becomes output_dir/<shard>/<resume stem><ext>. pdftoppm jobs
+    run through tool_runner (up to `workers` processes, each with a timeout
+    and retries); PyMuPDF jobs run in worker processes because PyMuPDF is
+    not thread-safe.
+    Returns (images written, failures).
+    """
+    check_partition(shard_index, shard_count)
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    pdf_files = [pdf for pdf in iter_files(pdf_dir, ".pdf") if owns_stem(first_stem(pdf), shard_index, shard_count)]
 
     if not pdf_files:
         print("No PDF files found.")
-        return
+        return 0, []
+
+    backend = resolve_backend(backend)
+    print(f"Rasterizing {len(pdf_files)} PDFs at {dpi} DPI ({fmt}, {backend}, {workers} workers)...")
+
+    converted = 0
+    failures = []
+    # Resumes per PDF, so progress and failures count resumes, not files
+    resumes = {pdf: len(load_batch_index(pdf) or [pdf]) for pdf in pdf_files}
+    metrics = StageMetrics("raster", total=sum(resumes.values()), workers=workers)
+
+    if backend == "pymupdf":
+        results = _pymupdf_results(pdf_files, output_dir, dpi, fmt, workers)
+    else:
+        jobs = ((pdf, convert_one_pdftoppm, (pdf, output_dir, dpi, fmt, timeout, retries)) for pdf in pdf_files)
+        results = stream_jobs(jobs, workers)
 
-    for pdf in pdf_files:
-        output_prefix = IMAGE_DIR / pdf.stem
+    for pdf, seconds, images, error in results:
+        if error is None:
+            converted += len(images)
+            metrics.record(seconds, len(images), sum(p.stat().st_size for p in images))
+        else:
+            metrics.record(seconds, resumes[pdf], failed=True)
+            failures.append((pdf, error))
+            print(f"❌ Failed: {pdf.name} → {error}")
 
-        command = [
-            PDFTOPPM,
-            "-png",
-            "-r", "300",
-            str(pdf.resolve()),
-            str(output_prefix.resolve())
-        ]
+    metrics.save()
 
-        print("Running:", " ".join(command))
+    print(f"\n✓ Rasterization Complete!")
+    print(f"  Resumes: {converted}")
+    print(f"  Failed PDFs: {len(failures)}")
 
-        try:
-            subprocess.run(command, check=True)
-            print(f"✅ Converted: {pdf.name}")
-        except Exception as e:
-            print(f"❌ Failed: {pdf.name} → {e}")
+    return converted, failures
 
 if __name__ == "__main__":
-    convert_pdf_to_images()
+    parser = argparse.ArgumentParser(description="Rasterize every PDF to page images.")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS)
+    parser.add_argument("--dpi", type=int, default=DPI)
+    parser.add_argument("--backend", choices=("auto", "pymupdf", "pdftoppm"), default=BACKEND)
+    parser.add_argument("--timeout", type=float, default=JOB_TIMEOUT,
+                        help="seconds per page before pdftoppm is killed and retried")
+    parser.add_argument("--retries", type=int, default=MAX_RETRIES)
+    add_partition_arguments(parser)
+    args = parser.parse_args()
+    convert_pdf_to_images(
+        dpi=args.dpi,
+        workers=args.workers,
+        backend=args.backend,
+        timeout=args.timeout,
+        retries=args.retries,
+        shard_index=args.shard_index,
+        shard_count=args.shard_count
+    )
@@ -4,13 +4,15 @@ from pathlib import Path
 # Paths
 TEMPLATE_PATH = Path("templates/template_1/resume.html")
 OUTPUT_PATH = Path("output/html/rendered_resume.html")
+DATA_DIR = Path("data/resumes")
 
-# Pick the first resume JSON file
-RESUME_JSON = list(Path("data/resumes").glob("*.json"))[0]
+def render_resume(resume_json=None):
+    # Pick the first resume JSON file unless one is given
+    if resume_json is None:
+        resume_json = next(DATA_DIR.glob("*.json"))
 
-def render_resume():
     # Load resume JSON
-    with open(RESUME_JSON, "r", encoding="utf-8") as f:
+    with open(resume_json, "r", encoding="utf-8") as f:
         data = json.load(f)
 
     # Load HTML template
@@ -0,0 +1,148 @@
+"""
+Sharded JSON Lines storage for resume records.
+
+Instead of one pretty-printed JSON file per resume, records are
+written as compact JSON Lines into fixed-size shards, optionally gzipped,
+under data/resumes/shards/ together with an index.json listing the shards
+in order. Readers stream records shard by shard from the index, so nothing
+has to list or sort a directory of a million files.
+
+Layout:
+    data/resumes/shards/index.json
+    data/resumes/shards/shard_00000.jsonl.gz
+    data/resumes/shards/shard_00001.jsonl.gz
+    ...
+
+Each shard records the position of its first record ("start"), so a store
+can also hold just one node's part of a dataset (write_indexed_shards())
+and iter_indexed_resumes() still gives every record its dataset index.
+"""
+import gzip
+import json
+from pathlib import Path
+
+DATA_DIR = Path("data/resumes")
+SHARD_SUBDIR = "shards"
+INDEX_NAME = "index.json"
+
+SHARD_SIZE = 10_000  # records per shard
+GZIP_LEVEL = 6       # zlib level; 9 is much slower for little gain on JSON
+
+def shard_dir(data_dir=DATA_DIR):
+    """Directory holding the shards and index for data_dir."""
+    return Path(data_dir) / SHARD_SUBDIR
+
+def _open_shard(path, mode):
+    if path.suffix == ".gz":
+        return gzip.open(path, mode + "t", encoding="utf-8", compresslevel=GZIP_LEVEL)
+    return open(path, mode, encoding="utf-8")
+
+def write_shards(resumes, data_dir=DATA_DIR, shard_size=SHARD_SIZE, compress=False):
+    """Stream resume dicts into JSONL shards and write the shard index.
+
+    Returns the number of records written.
+    """
+    return write_indexed_shards(enumerate(resumes, start=1), data_dir, shard_size, compress)
+
+def write_indexed_shards(records, data_dir=DATA_DIR, shard_size=SHARD_SIZE, compress=False):
+    """write_shards() for (idx, resume) pairs in increasing 1-based idx order.
+
+    The indexes may have gaps (e.g. one node's part of a dataset): a new
+    shard starts wherever idx skips ahead. Returns the number of records written.
+    """
+    out_dir = shard_dir(data_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    suffix = ".jsonl.gz" if compress else ".jsonl"
+    index_path = out_dir / INDEX_NAME
+    # Shards of an earlier store are overwritten in place, so its index must
+    # go first or a crashed run would mix new and stale records
+    index_path.unlink(missing_ok=True)
+
+    shards = []
+    total = 0
+    f = None
+    try:
+        for idx, resume in records:
+            last = shards[-1] if shards else None
+            if last is None or last["count"] == shard_size or idx - 1 != last["start"] + last["count"]:
+                if f is not None:
+                    f.close()
+                name = f"shard_{len(shards):05d}{suffix}"
+                shards.append({"file": name, "start": idx - 1, "count": 0})
+                f = _open_shard(out_dir / name, "w")
+            f.write(json.dumps(resume, separators=(",", ":"), ensure_ascii=False))
+            f.write("\n")
+            shards[-1]["count"] += 1
+            total += 1
+    finally:
+        if f is not None:
+            f.close()
+
+    # Drop shards of an earlier, larger (or differently compressed) store
+    names = {shard["file"] for shard in shards}
+    for stale in out_dir.glob("shard_*.jsonl*"):
+        if stale.name not in names:
+            stale.unlink()
+
+    index = {
+        "format": "jsonl",
+        "compression": "gzip" if compress else None,
+        "shard_size": shard_size,
+        "total": total,
+        "shards": shards
+    }
+    # Write the index last so a crashed run never looks complete
+    tmp_path = index_path.with_suffix(".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=2)
+    tmp_path.replace(index_path)
+
+    return total
+
+def load_index(data_dir=DATA_DIR):
+    """Return the shard index, or None if data_dir holds no sharded dataset."""
+    index_path = shard_dir(data_dir) / INDEX_NAME
+    if not index_path.exists():
+        return None
+    with open(index_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def iter_resumes(data_dir=DATA_DIR):
+    """Yield (record_id, resume) in dataset order.
+
+    Reads the sharded JSONL store when present (record_id is the record's
+    position), otherwise falls back to the per-file layout (record_id is
+    the file stem, in sorted order).
+    """
+    index = load_index(data_dir)
+
+    if index is None:
+        for resume_file in sorted(Path(data_dir).glob("*.json")):
+            with open(resume_file, "r", encoding="utf-8") as f:
+                yield resume_file.stem, json.load(f)
+        return
+
+    for shard in index["shards"]:
+        with _open_shard(shard_dir(data_dir) / shard["file"], "r") as f:
+            for offset, line in enumerate(f):
+                yield f"{shard['start'] + offset:07d}", json.loads(line)
+
+def iter_indexed_resumes(data_dir=DATA_DIR):
+    """Yield (idx, resume) in dataset order, idx being the record's 1-based dataset index.
+
+    Per-file records named by index (0000042.json) keep that index; other
+    file names are numbered in sorted order.
+    """
+    if load_index(data_dir) is None:
+        for position, (record_id, resume) in enumerate(iter_resumes(data_dir), start=1):
+            yield (int(record_id) if record_id.isdigit() else position), resume
+        return
+    for record_id, resume in iter_resumes(data_dir):
+        yield int(record_id) + 1, resume
+
+def count_resumes(data_dir=DATA_DIR):
+    """Number of resume records, from the shard index when available."""
+    index = load_index(data_dir)
+    if index is not None:
+        return index["total"]
+    return sum(1 for _ in Path(data_dir).glob("*.json"))
@@ -1,15 +1,40 @@
 """
 Master pipeline script to run all stages of resume generation.
 Executes: JSON → HTML → PDF → Image → Clean/Noisy → Annotations
+
+Stages run in this process by calling each script's entry function, so
+PIL, NumPy, the compiled templates and layouts are loaded once, progress
+lines appear as they are printed, and the raster stage writes straight to
+the clean image folder instead of being moved there afterwards.
+
+With --direct the HTML is rendered straight to page images by
+wkhtmltoimage (html_to_image.py) and no PDFs are made.
 """
 
-import subprocess
+import argparse
 import sys
-from pathlib import Path
 import time
+import traceback
+
+from add_noise import add_noise_and_augment
+from batch_render import TEMPLATE_SEED, render_all_resumes
+from create_annotations import create_annotations
+from dataset_paths import (
+    ANNOT_DIR, CLEAN_DIR, HTML_DIR, NOISY_ANNOT_DIR, NOISY_DIR, PDF_DIR, add_partition_arguments, check_partition
+)
+from generate_resumes import SEED, save_resumes
+from html_to_image import convert_html_to_images
+from html_to_pdf import convert_html_to_pdf
+from metrics import clear_stage_metrics, load_stage_metrics, print_report, write_report
+from page_stage import run_page_stage
+from pdf_to_image import convert_pdf_to_images
+from resume_store import DATA_DIR
 
-def run_step(step_name, script_name, description):
-    """Run a pipeline step and report results."""
+def run_step(step_name, description, stage, **kwargs):
+    """Run a pipeline stage's entry function with kwargs and report results.
+
+    Returns the stage's (count, failures), or None if it raised.
+    """
     print("\n" + "="*70)
     print(f"STEP: {step_name}")
     print(f"Description: {description}")
@@ -18,127 +43,275 @@ def run_step(step_name, script_name, description):
     start_time = time.time()
     
     try:
-        result = subprocess.run(
-            [sys.executable, script_name],
-            check=True,
-            capture_output=True,
-            text=True
-        )
-        print(result.stdout)
-        elapsed = time.time() - start_time
+        count, failures = stage(**kwargs)
+    except Exception as e:
+        traceback.print_exc()
+        print(f"❌ {step_name} FAILED! ({e})")
+        return None
+    elapsed = time.time() - start_time
+    if failures:
+        print(f"⚠️  {step_name} completed in {elapsed:.2f} seconds with {len(failures)} failures")
+    else:
         print(f"✓ {step_name} completed in {elapsed:.2f} seconds")
-        return True
-    except subprocess.CalledProcessError as e:
-        print(f"❌ {step_name} FAILED!")
-        print(e.stderr)
-        return False
+    return count, failures
 
-def move_images_to_clean():
-    """Move generated images to clean folder."""
-    print("\n" + "="*70)
-    print("STEP: Move Images to Clean Folder")
-    print("="*70)
-    
-    images_dir = Path("output/images")
-    clean_dir = images_dir / "clean"
-    
-    # Get all PNG files in the root images directory
-    png_files = list(images_dir.glob("*.png"))
-    
-    if not png_files:
-        print("No images found to move.")
-        return True
-    
-    moved = 0
-    for img_file in png_files:
-        try:
-            img_file.rename(clean_dir / img_file.name)
-            moved += 1
-        except Exception as e:
-            print(f"Error moving {img_file.name}: {e}")
-    
-    print(f"✓ Moved {moved} images to clean/ folder")
-    return True
+def run_streaming(count, keep_intermediates, incremental=False, shard_index=0, shard_count=1, seed=SEED,
+                  template_seed=TEMPLATE_SEED, workers=None):
+    """Run all stages per resume through bounded queues (see stream_pipeline.py).
+
+    workers sets every stage's thread count (None keeps STAGE_WORKERS).
+    With incremental=True, output/manifest.sqlite records each stage's
+    inputs and only changed or unfinished work is redone.
+    Returns True if no resume failed.
+    """
+    from manifest import MANIFEST_PATH, Manifest
+    from stream_pipeline import STAGE_WORKERS, run_streaming_pipeline
+
+    print("\n" + "🚀 "*20)
+    print(" RESUME GENERATION PIPELINE - STREAMING EXECUTION")
+    print("🚀 "*20)
+    print(f"\nEach of {count} resumes flows JSON → HTML → PDF → PNG → noisy + label")
+    print("Finished samples appear as soon as each resume is done")
+    if incremental:
+        print(f"Incremental: unchanged work recorded in {MANIFEST_PATH} is skipped")
+
+    input("\nPress ENTER to start the pipeline...")
+
+    overall_start = time.time()
+    options = {
+        "keep_intermediates": keep_intermediates,
+        "shard_index": shard_index,
+        "shard_count": shard_count,
+        "seed": seed,
+        "template_seed": template_seed,
+        "workers": None if workers is None else dict.fromkeys(STAGE_WORKERS, workers)
+    }
+    if incremental:
+        with Manifest() as manifest:
+            completed, failures = run_streaming_pipeline(count, manifest=manifest, **options)
+    else:
+        completed, failures = run_streaming_pipeline(count, **options)
+    total_time = time.time() - overall_start
+
+    if failures:
+        print(f"\n⚠️  {len(failures)} resumes failed; see errors above.")
+    print(f"\nTotal execution time: {total_time/60:.2f} minutes")
+    print("\nGenerated files:")
+    print(f"  - {count} JSON resumes in data/resumes/shards/")
+    print(f"  - {completed} clean images in output/images/clean/")
+    print(f"  - {completed} noisy images in output/images/noisy/")
+    print(f"  - {completed} annotation files in annotations/")
+    return not failures
+
+def main(stream=False, count=1000, keep_intermediates=False, incremental=False, fused=False,
+         image_format="png", variants=1, shard_index=0, shard_count=1, seed=SEED,
+         template_seed=TEMPLATE_SEED, workers=None, direct=False, measured=False, data_dir=DATA_DIR,
+         html_dir=HTML_DIR, pdf_dir=PDF_DIR, clean_dir=CLEAN_DIR, noisy_dir=NOISY_DIR, annot_dir=ANNOT_DIR,
+         noisy_annot_dir=NOISY_ANNOT_DIR):
+    """Run every stage; workers=None leaves each stage at its own default.
+
+    The *_dir arguments are handed to the stages that read or write them.
+    Streaming and incremental runs always use the default folders.
+
+    direct=True renders HTML straight to images, skipping the PDF stage.
+    Direct pages have no print margins, so the template's box fractions do
+    not fit them and labels are always measured (measured=True).
+
+    Returns True if every stage finished without failures.
+    """
+    check_partition(shard_index, shard_count)
+    if direct and (fused or stream or incremental):
+        raise ValueError("direct rendering only applies to the stage-by-stage pipeline")
+    if (stream or incremental) and (variants != 1 or image_format != "png" or measured):
+        raise ValueError("streaming makes one noisy PNG copy per resume with the template's label boxes")
+    if stream or incremental:
+        return run_streaming(
+            count, keep_intermediates, incremental, shard_index, shard_count, seed, template_seed, workers
+        )
+
+    measured = measured or direct
+
+    # Every stage handles only this node's part of the dataset (see merge_nodes.py)
+    part = {"shard_index": shard_index, "shard_count": shard_count}
+    pool = {} if workers is None else {"workers": workers}
 
-def main():
     print("\n" + "🚀 "*20)
     print(" RESUME GENERATION PIPELINE - FULL EXECUTION")
     print("🚀 "*20)
-    print("\nThis will generate 1000 resumes with 10 different templates")
+    print(f"\nThis will generate {count} resumes with 10 different templates")
     print("Total stages: 6")
     print("\n⚠️  This may take several minutes to complete...")
     
     input("\nPress ENTER to start the pipeline...")
     
     overall_start = time.time()
+    clear_stage_metrics()
+    # (count, failures) of each stage that runs
+    converted = rasterized = labelled = augmented = paged = None
     
     # Stage 1: Generate JSON resumes
-    if not run_step(
+    generated = run_step(
         "1/6 - Generate JSON Resumes",
-        "generate_resumes.py",
-        "Creating 1000 unique resume JSON files"
-    ):
-        return
+        f"Creating {count} unique resume JSON files",
+        save_resumes, n=count, seed=seed, data_dir=data_dir, **part
+    )
+    if generated is None:
+        return False
     
     # Stage 2: Render HTML with templates
-    if not run_step(
+    rendered = run_step(
         "2/6 - Render HTML",
-        "batch_render.py",
-        "Converting JSON to HTML using 10 random templates"
-    ):
-        return
-    
-    # Stage 3: Convert HTML to PDF
-    if not run_step(
-        "3/6 - HTML → PDF",
-        "html_to_pdf.py",
-        "Converting HTML files to PDF format"
-    ):
-        return
-    
-    # Stage 4: Convert PDF to Images
-    if not run_step(
-        "4/6 - PDF → Images",
-        "pdf_to_image.py",
-        "Converting PDFs to 300 DPI PNG images"
-    ):
-        return
-    
-    # Stage 5: Move images and create noisy versions
-    if not move_images_to_clean():
-        return
+        "Converting JSON to HTML using 10 random templates",
+        render_all_resumes, seed=template_seed, data_dir=data_dir, output_dir=html_dir, **part
+    )
+    if rendered is None:
+        return False
     
-    if not run_step(
-        "5/6 - Generate Noisy Images",
-        "add_noise.py",
-        "Creating augmented noisy versions of clean images"
-    ):
-        return
+    if direct:
+        # Stages 3-4 in one process per resume: no PDF is written or parsed
+        rasterized = run_step(
+            "3-4/6 - HTML → Images",
+            "Rendering HTML straight to 300 DPI PNG images with wkhtmltoimage",
+            convert_html_to_images, output_dir=clean_dir, html_dir=html_dir, **pool, **part
+        )
+        if rasterized is None:
+            return False
+    else:
+        # Stage 3: Convert HTML to PDF
+        converted = run_step(
+            "3/6 - HTML → PDF",
+            "Converting HTML files to PDF format",
+            convert_html_to_pdf, html_dir=html_dir, pdf_dir=pdf_dir, **pool, **part
+        )
+        if converted is None:
+            return False
     
-    # Stage 6: Create annotations
-    if not run_step(
-        "6/6 - Create Annotations",
-        "create_annotations.py",
-        "Generating YOLO-format annotations for all templates"
-    ):
-        return
+    if fused:
+        # Stages 4-6 in one pass: each page is decoded once
+        paged = run_step(
+            "4-6/6 - PDF → Clean + Noisy Images + Annotations",
+            "Rasterizing, augmenting and labelling each page in memory",
+            run_page_stage, fmt=image_format, measured=measured, variants=variants, pdf_dir=pdf_dir,
+            clean_dir=clean_dir, noisy_dir=noisy_dir, annot_dir=annot_dir, noisy_annot_dir=noisy_annot_dir,
+            **pool, **part
+        )
+        if paged is None:
+            return False
+    else:
+        # Stage 4: Convert PDF to Images, straight into the clean folder
+        if not direct:
+            rasterized = run_step(
+                "4/6 - PDF → Images",
+                "Converting PDFs to 300 DPI PNG images",
+                convert_pdf_to_images, output_dir=clean_dir, pdf_dir=pdf_dir, **pool, **part
+            )
+            if rasterized is None:
+                return False
+
+        # Stage 5: Create annotations (before augmenting, which rotates them per noisy copy)
+        labelled = run_step(
+            "5/6 - Create Annotations",
+            "Generating YOLO-format annotations for all templates",
+            create_annotations, measured=measured, clean_dir=clean_dir, annot_dir=annot_dir, pdf_dir=pdf_dir,
+            **pool, **part
+        )
+        if labelled is None:
+            return False
+
+        # Stage 6: Create noisy versions
+        augmented = run_step(
+            "6/6 - Generate Noisy Images",
+            "Creating augmented noisy versions of clean images and their labels",
+            add_noise_and_augment, variants=variants, clean_dir=clean_dir, noisy_dir=noisy_dir,
+            annot_dir=annot_dir, noisy_annot_dir=noisy_annot_dir, **pool, **part
+        )
+        if augmented is None:
+            return False
     
     # Summary
     total_time = time.time() - overall_start
-    
-    print("\n" + "✅ "*20)
-    print(" PIPELINE COMPLETED SUCCESSFULLY!")
-    print("✅ "*20)
+    results = [generated, rendered, converted, rasterized, labelled, augmented, paged]
+    failed = sum(len(result[1]) for result in results if result is not None)
+
+    if failed:
+        print("\n" + "⚠️ "*20)
+        print(f" PIPELINE COMPLETED WITH {failed} FAILURES (see ❌ lines above)")
+        print("⚠️ "*20)
+    else:
+        print("\n" + "✅ "*20)
+        print(" PIPELINE COMPLETED SUCCESSFULLY!")
+        print("✅ "*20)
     print(f"\nTotal execution time: {total_time/60:.2f} minutes")
+    if fused:
+        # The page stage writes each page's clean image, label and noisy copies together
+        images = labels = paged[0]
+        noisy = paged[0] * variants
+    else:
+        images, labels = rasterized[0], labelled[0]
+        noisy = augmented[0] * variants
     print("\nGenerated files:")
-    print("  - 1000 JSON resumes in data/resumes/")
-    print("  - 1000 HTML files in output/html/")
-    print("  - 1000 PDF files in output/pdf/")
-    print("  - 1000 clean images in output/images/clean/")
-    print("  - 1000 noisy images in output/images/noisy/")
-    print("  - 1000 annotation files in annotations/")
-    print("\nDataset is ready for CNN training!")
+    print(f"  - {generated[0]} JSON resumes in {data_dir}/")
+    print(f"  - {rendered[0]} HTML files in {html_dir}/")
+    if not direct:
+        print(f"  - {converted[0]} resumes rendered to PDF in {pdf_dir}/")
+    print(f"  - {images} clean images in {clean_dir}/")
+    print(f"  - {noisy} noisy images in {noisy_dir}/")
+    print(f"  - {labels} annotation files in {annot_dir}/, rotated copies in {noisy_annot_dir}/")
+
+    summaries = load_stage_metrics()
+    print_report(summaries)
+    print(f"\nPer-stage metrics: {write_report(summaries)}")
+    if not failed:
+        print("\nDataset is ready for CNN training!")
     print("\nSee README_SCALING.md for detailed documentation.")
+    return not failed
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Run the full resume generation pipeline.")
+    parser.add_argument("--stream", action="store_true",
+                        help="stream each resume through all stages instead of stage by stage")
+    parser.add_argument("--count", type=int, default=1000,
+                        help="number of resumes in the dataset")
+    parser.add_argument("--keep-intermediates", action="store_true",
+                        help="keep HTML and PDF files in streaming mode")
+    parser.add_argument("--incremental", action="store_true",
+                        help="stream, skipping work the manifest shows is up to date (resumes after a crash)")
+    parser.add_argument("--fused", action="store_true",
+                        help="rasterize, augment and label each page in one pass (page_stage.py)")
+    parser.add_argument("--image-format", choices=("png", "webp", "jpeg"), default="png",
+                        help="image encoding with --fused")
+    parser.add_argument("--direct", action="store_true",
+                        help="render HTML straight to images with wkhtmltoimage, without PDFs (implies --measured)")
+    parser.add_argument("--measured", action="store_true",
+                        help="fit each label box to the rendered page instead of using the template's fractions")
+    parser.add_argument("--variants", type=int, default=1,
+                        help="noisy copies per clean image, each with its own rotated label")
+    parser.add_argument("--seed", type=int, default=SEED,
+                        help="seed of the resume records")
+    parser.add_argument("--template-seed", type=int, default=TEMPLATE_SEED,
+                        help="seed of the template assignment")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="worker processes per stage (default: each stage's own)")
+    add_partition_arguments(parser)
+    args = parser.parse_args()
+    if args.direct and (args.fused or args.stream or args.incremental):
+        parser.error("--direct only applies to the stage-by-stage pipeline (not --fused, --stream or --incremental)")
+    if (args.stream or args.incremental) and (args.variants != 1 or args.image_format != "png" or args.measured):
+        parser.error("--variants, --image-format and --measured do not apply to --stream or --incremental")
+    ok = main(
+        stream=args.stream,
+        count=args.count,
+        keep_intermediates=args.keep_intermediates,
+        incremental=args.incremental,
+        fused=args.fused,
+        image_format=args.image_format,
+        variants=args.variants,
+        shard_index=args.shard_index,
+        shard_count=args.shard_count,
+        seed=args.seed,
+        template_seed=args.template_seed,
+        workers=args.workers,
+        direct=args.direct,
+        measured=args.measured
+    )
+    sys.exit(0 if ok else 1)
@@ -1,47 +1,200 @@
+"""
+Split the labeled images into a YOLO train/val dataset.
+
+The split is seeded and stratified by template ID, so every template gets
+the same train/val ratio and reruns give the same split. A resume's clean
+and noisy images always land in the same split. Files are placed without
+copying where possible:
+
+- hardlink (default): another directory entry for the same file; no extra
+  disk space, falls back to copying across filesystems
+- symlink: links pointing back to output/ and annotations/
+- reflink: copy-on-write clone (Btrfs, XFS, ...); falls back to copying
+- copy: full copies, done in parallel
+- list: no image files are placed; yolo_dataset/train.txt and val.txt list
+  the image paths and labels are linked next to them where YOLO looks
+  (output/labels/<clean|noisy>/<shard>/)
+
+Images and labels keep their shard subdirectories inside each split
+(yolo_dataset/images/train/0000/...); YOLO searches split directories
+recursively.
+"""
+import argparse
+import os
 import random
 import shutil
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+from create_annotations import extract_template_id, load_page_templates
+from dataset_paths import ANNOT_DIR as LABEL_DIR, CLEAN_DIR as CLEAN_IMG_DIR, NOISY_DIR as NOISY_IMG_DIR
+from dataset_paths import IMAGE_SUFFIXES, NOISY_ANNOT_DIR, PDF_DIR, find_image, find_variants, item_path, iter_files
+
 # Paths
-CLEAN_IMG_DIR = Path("output/images/clean")
-LABEL_DIR = Path("annotations")
-
-YOLO_IMG_TRAIN = Path("yolo_dataset/images/train")
-YOLO_IMG_VAL = Path("yolo_dataset/images/val")
-YOLO_LBL_TRAIN = Path("yolo_dataset/labels/train")
-YOLO_LBL_VAL = Path("yolo_dataset/labels/val")
-
-# Create folders
-YOLO_IMG_TRAIN.mkdir(parents=True, exist_ok=True)
-YOLO_IMG_VAL.mkdir(parents=True, exist_ok=True)
-YOLO_LBL_TRAIN.mkdir(parents=True, exist_ok=True)
-YOLO_LBL_VAL.mkdir(parents=True, exist_ok=True)
-
-# Collect images
-images = sorted(CLEAN_IMG_DIR.glob("*.png"))
-random.shuffle(images)
-
-split_idx = int(0.8 * len(images))
-train_imgs = images[:split_idx]
-val_imgs = images[split_idx:]
-
-def copy_pair(img_path, img_dst, lbl_dst):
-    lbl_path = LABEL_DIR / f"{img_path.stem}.txt"
-    if not lbl_path.exists():
-        raise FileNotFoundError(f"Missing label for {img_path.name}")
-
-    shutil.copy(img_path, img_dst / img_path.name)
-    shutil.copy(lbl_path, lbl_dst / lbl_path.name)
-
-# Copy training data
-for img in train_imgs:
-    copy_pair(img, YOLO_IMG_TRAIN, YOLO_LBL_TRAIN)
-
-# Copy validation data
-for img in val_imgs:
-    copy_pair(img, YOLO_IMG_VAL, YOLO_LBL_VAL)
-
-print(f"Total images      : {len(images)}")
-print(f"Training images   : {len(train_imgs)}")
-print(f"Validation images : {len(val_imgs)}")
-print("YOLO dataset split completed successfully.")
+YOLO_DIR = Path("yolo_dataset")
+
+SPLIT_SEED = 0
+TRAIN_FRACTION = 0.8
+LINK_MODES = ("hardlink", "symlink", "reflink", "copy", "list")
+LINK_MODE = "hardlink"
+MAX_WORKERS = 16  # placement is I/O-bound
+
+FICLONE = 0x40049409  # Linux ioctl: clone src's extents into dst
+
+def _reflink(src, dst):
+    import fcntl  # not available on Windows; the caller falls back to a copy
+    with open(src, "rb") as s, open(dst, "wb") as d:
+        fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+
+def place_file(src, dst, mode):
+    """Place src at dst using mode. Returns True if it fell back to copying."""
+    try:
+        if mode == "hardlink":
+            os.link(src, dst)
+        elif mode == "symlink":
+            os.symlink(src.resolve(), dst)
+        elif mode == "reflink":
+            _reflink(src, dst)
+        else:
+            shutil.copyfile(src, dst)
+        return False
+    except (OSError, ImportError):
+        if mode in ("copy", "symlink"):
+            raise
+        # Cross-device hardlink or no reflink support on this filesystem
+        shutil.copyfile(src, dst)
+        return True
+
+def stratified_split(stems, template_of, train_fraction=TRAIN_FRACTION, seed=SPLIT_SEED):
+    """Split stems into (train, val) with train_fraction of each template in train."""
+    rng = random.Random(seed)
+    by_template = defaultdict(list)
+    for stem in sorted(stems):
+        by_template[template_of(stem)].append(stem)
+
+    train, val = [], []
+    for template_id in sorted(by_template):
+        group = by_template[template_id]
+        rng.shuffle(group)
+        split_idx = int(round(train_fraction * len(group)))
+        train.extend(group[:split_idx])
+        val.extend(group[split_idx:])
+    return train, val
+
+def collect_pairs(stems, include_noisy, clean_dir=CLEAN_IMG_DIR, noisy_dir=NOISY_IMG_DIR, annot_dir=LABEL_DIR,
+                  noisy_annot_dir=NOISY_ANNOT_DIR):
+    """(image, label, dataset name) for each stem's clean image and noisy variants.
+
+    Noisy images use their own rotated label when add_noise.py wrote one,
+    otherwise the clean label.
+    """
+    pairs = []
+    for stem in stems:
+        label = item_path(annot_dir, stem, ".txt")
+        pairs.append((find_image(clean_dir, stem), label, stem))
+        for noisy in (find_variants(noisy_dir, stem) if include_noisy else []):
+            noisy_label = item_path(noisy_annot_dir, noisy.stem, ".txt")
+            pairs.append((noisy, noisy_label if noisy_label.exists() else label, f"{noisy.stem}_noisy"))
+    return pairs
+
+def yolo_label_path(img):
+    """Where YOLO looks for img's label: the last /images/ swapped for /labels/."""
+    parts = img.resolve().parts
+    i = len(parts) - 1 - parts[::-1].index("images")
+    return Path(*parts[:i], "labels", *parts[i + 1:]).with_suffix(".txt")
+
+def _clear_split_dirs(yolo_dir=YOLO_DIR):
+    for sub in ("images", "labels"):
+        shutil.rmtree(yolo_dir / sub, ignore_errors=True)
+    for name in ("train.txt", "val.txt"):
+        (yolo_dir / name).unlink(missing_ok=True)
+
+def _place_split(split, pairs, mode, pool, yolo_dir=YOLO_DIR):
+    """Submit placement jobs for one split; returns the futures."""
+    futures = []
+    if mode == "list":
+        # YOLO finds labels by swapping /images/ for /labels/ in the image path
+        lines = []
+        for img, label, _ in pairs:
+            dst = yolo_label_path(img)
+            dst.parent.mkdir(parents=True, exist_ok=True)
+            dst.unlink(missing_ok=True)
+            futures.append(pool.submit(place_file, label, dst, "hardlink"))
+            lines.append(str(img.resolve()))
+        with open(yolo_dir / f"{split}.txt", "w") as f:
+            f.write("\n".join(lines) + "\n")
+        return futures
+
+    img_dir = yolo_dir / "images" / split
+    lbl_dir = yolo_dir / "labels" / split
+    made = set()
+    for img, label, name in pairs:
+        shard = img.parent.name if img.parent.name.isdigit() else ""
+        if shard not in made:
+            (img_dir / shard).mkdir(parents=True, exist_ok=True)
+            (lbl_dir / shard).mkdir(parents=True, exist_ok=True)
+            made.add(shard)
+        futures.append(pool.submit(place_file, img, img_dir / shard / f"{name}{img.suffix}", mode))
+        futures.append(pool.submit(place_file, label, lbl_dir / shard / f"{name}.txt", mode))
+    return futures
+
+def split_dataset(mode=LINK_MODE, seed=SPLIT_SEED, train_fraction=TRAIN_FRACTION,
+                  include_noisy=True, workers=MAX_WORKERS, yolo_dir=YOLO_DIR, clean_dir=CLEAN_IMG_DIR,
+                  noisy_dir=NOISY_IMG_DIR, annot_dir=LABEL_DIR, noisy_annot_dir=NOISY_ANNOT_DIR, pdf_dir=PDF_DIR):
+    """Rebuild yolo_dir (yolo_dataset/) from the clean (and noisy) images and their labels.
+
+    pdf_dir holds the batch page indexes that map images to templates.
+    Returns (train_count, val_count) in images.
+    """
+    if mode not in LINK_MODES:
+        raise ValueError(f"mode must be one of {', '.join(LINK_MODES)}")
+
+    yolo_dir = Path(yolo_dir)
+    stems = [p.stem for p in iter_files(clean_dir, IMAGE_SUFFIXES)]
+
+    missing = [s for s in stems if not item_path(annot_dir, s, ".txt").exists()]
+    if missing:
+        raise FileNotFoundError(f"Missing label for {len(missing)} images, e.g. {missing[0]}")
+
+    page_templates = load_page_templates(pdf_dir)
+
+    def template_of(stem):
+        return page_templates.get(stem) or extract_template_id(stem)
+
+    train_stems, val_stems = stratified_split(stems, template_of, train_fraction, seed)
+    dirs = (clean_dir, noisy_dir, annot_dir, noisy_annot_dir)
+    train = collect_pairs(train_stems, include_noisy, *dirs)
+    val = collect_pairs(val_stems, include_noisy, *dirs)
+
+    _clear_split_dirs(yolo_dir)
+    yolo_dir.mkdir(parents=True, exist_ok=True)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = _place_split("train", train, mode, pool, yolo_dir) + _place_split("val", val, mode, pool, yolo_dir)
+        copied = sum(f.result() for f in futures)
+
+    print(f"Total images      : {len(train) + len(val)}")
+    print(f"Training images   : {len(train)}")
+    print(f"Validation images : {len(val)}")
+    print(f"Placement mode    : {mode}")
+    if copied:
+        print(f"⚠️  {copied} files were copied because {mode} is not supported here")
+    print("YOLO dataset split completed successfully.")
+    return len(train), len(val)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Split labeled images into a YOLO train/val dataset.")
+    parser.add_argument("--mode", choices=LINK_MODES, default=LINK_MODE,
+                        help="how files are placed in yolo_dataset/ (default: hardlink)")
+    parser.add_argument("--seed", type=int, default=SPLIT_SEED)
+    parser.add_argument("--train-fraction", type=float, default=TRAIN_FRACTION)
+    parser.add_argument("--no-noisy", action="store_true",
+                        help="only use the clean images")
+    args = parser.parse_args()
+    split_dataset(
+        mode=args.mode,
+        seed=args.seed,
+        train_fraction=args.train_fraction,
+        include_noisy=not args.no_noisy
+    )
@@ -0,0 +1,300 @@
+"""
+Streaming pipeline: JSON → HTML → PDF → PNG → noisy image + label per resume.
+
+Instead of running each stage over the whole dataset before the next one
+starts, every resume flows through the stages on its own. Stages are
+connected by bounded queues and each runs its own pool of worker threads
+(the PDF and raster stages wait on external processes, so threads are
+enough). The first finished samples appear within seconds, and because at
+most QUEUE_SIZE items wait between stages and intermediate HTML/PDF files
+are deleted once consumed, disk use for intermediates stays bounded.
+
+With a manifest (see manifest.py) each item only redoes the stages whose
+inputs changed, so interrupted runs resume and template edits only
+re-render the affected resumes.
+"""
+import json
+import os
+import queue
+import threading
+import time
+
+from PIL import Image
+
+from add_noise import AUGMENT_VERSION, augment, augment_image, image_rng, remove_stale_variants, save_image
+from batch_render import TEMPLATE_SEED, render_resume_html, template_for
+from create_annotations import label_text, rotate_label_text, write_annotation
+from dataset_paths import ANNOT_DIR, CLEAN_DIR, HTML_DIR, NOISY_ANNOT_DIR, NOISY_DIR, PDF_DIR, output_path, resume_stem
+from dataset_paths import owned_ranges
+from generate_resumes import SEED, iter_resume_records
+from html_to_pdf import convert_html_string
+from manifest import STAGES as MANIFEST_STAGES, digest, layout_fingerprint, template_fingerprint
+from metrics import StageMetrics, clear_stage_metrics, format_eta, print_report, write_report
+from page_stage import render_first_page
+from pdf_to_image import DPI
+from resume_store import write_indexed_shards
+
+QUEUE_SIZE = 32  # max items waiting between two stages
+# Items entering augment carry a decoded page (~25 MB at 300 DPI)
+STAGE_QUEUE_SIZES = {"augment": 4}
+
+# Worker threads per stage
+CPU_COUNT = os.cpu_count() or 4
+STAGE_WORKERS = {
+    "render": 1,
+    "pdf": CPU_COUNT,
+    "raster": CPU_COUNT,
+    "augment": max(1, CPU_COUNT // 2)
+}
+
+_DONE = object()  # end-of-stream marker
+
+def plan_item(item, html, manifest):
+    """Compute chained stage input hashes and the set of stages to run."""
+    template_id = item["template_id"]
+    record = json.dumps(item["data"], sort_keys=True, separators=(",", ":"))
+
+    hashes = {"json": digest(record)}
+    hashes["html"] = digest(hashes["json"], template_id, template_fingerprint(template_id))
+    hashes["pdf"] = digest(html)
+    hashes["png"] = digest(hashes["pdf"], DPI)
+    hashes["label"] = digest(hashes["png"], layout_fingerprint(template_id))
+    # The noisy image comes with a rotated copy of the label
+    hashes["noisy"] = digest(hashes["label"], AUGMENT_VERSION)
+    item["hashes"] = hashes
+
+    if manifest is None:
+        item["todo"] = set(MANIFEST_STAGES)
+        return
+
+    # is_fresh() also checks that the output file still exists
+    fresh = {s: manifest.is_fresh(item["stem"], s, hashes[s]) for s in ("pdf", "png", "noisy", "label")}
+    todo = {s for s in ("noisy", "label") if not fresh[s]}
+    if not fresh["png"]:
+        todo.add("png")
+    if "png" in todo and not fresh["pdf"]:
+        todo.add("pdf")
+    item["todo"] = todo
+
+def _mark_done(item, options, stage, output=None):
+    if options["manifest"] is not None:
+        options["manifest"].mark_done(item["stem"], stage, item["hashes"][stage], output)
+
+def render_stage(item, options):
+    item["current"] = "html"
+    html = render_resume_html(item["data"], item["template_id"])
+    plan_item(item, html, options["manifest"])
+    del item["data"]
+
+    html_path = None
+    if options["keep_intermediates"]:
+        html_path = output_path(HTML_DIR, item["stem"], ".html")
+        with open(html_path, "w", encoding="utf-8") as f:
+            f.write(html)
+        item["written"] = html_path.stat().st_size
+    _mark_done(item, options, "json")
+    _mark_done(item, options, "html", html_path)
+
+    if "pdf" in item["todo"]:
+        item["html"] = html
+    return item
+
+def pdf_stage(item, options):
+    pdf = output_path(PDF_DIR, item["stem"], ".pdf")
+    if "pdf" in item["todo"]:
+        item["current"] = "pdf"
+        error = convert_html_string(item.pop("html"), pdf)
+        if error is not None:
+            raise RuntimeError(error)
+        item["written"] = pdf.stat().st_size
+        _mark_done(item, options, "pdf", pdf)
+    item["pdf"] = pdf
+    return item
+
+def raster_stage(item, options):
+    pdf = item.pop("pdf")
+    png = output_path(CLEAN_DIR, item["stem"], ".png")
+    if "png" in item["todo"]:
+        item["current"] = "png"
+        try:
+            # Stage workers are threads and PyMuPDF is not thread-safe. The page
+            # is decoded once and handed to the augment stage in memory.
+            img = render_first_page(pdf, DPI, backend="pdftoppm")
+            save_image(img, png)
+            if "noisy" in item["todo"]:
+                item["image"] = img
+            item["written"] = png.stat().st_size
+        finally:
+            if not options["keep_intermediates"]:
+                pdf.unlink(missing_ok=True)
+        _mark_done(item, options, "png", png)
+    item["png"] = png
+    return item
+
+def augment_stage(item, options):
+    png = item["png"]
+    if not item["todo"] & {"noisy", "label"}:
+        return item
+
+    item["current"] = "label"
+    template_id = f"{item['template_id']:02d}"
+    text = label_text(template_id)
+    if text is None:
+        raise RuntimeError(f"no layout_config.json for template {template_id}")
+
+    if "label" in item["todo"]:
+        label = write_annotation(png.stem, text)
+        item["written"] = len(text)
+        _mark_done(item, options, "label", label)
+
+    if "noisy" in item["todo"]:
+        item["current"] = "noisy"
+        # Streaming makes one noisy copy; drop _v<k> copies of a batch run
+        remove_stale_variants(png.stem, 1)
+        noisy = output_path(NOISY_DIR, png.stem, ".png")
+        img = item.pop("image", None)
+        if img is None:
+            # Clean image is up to date from an earlier run
+            angle = augment_image(png, noisy)
+            with Image.open(png) as clean:
+                size = clean.size
+        else:
+            out, angle = augment(img, image_rng(png.name))
+            save_image(out, noisy)
+            size = img.size
+        noisy_text = rotate_label_text(text, angle, *size)
+        write_annotation(png.stem, noisy_text, NOISY_ANNOT_DIR)
+        item["written"] = item.get("written", 0) + noisy.stat().st_size + len(noisy_text)
+        _mark_done(item, options, "noisy", noisy)
+    return item
+
+STAGES = [
+    ("render", render_stage),
+    ("pdf", pdf_stage),
+    ("raster", raster_stage),
+    ("augment", augment_stage)
+]
+
+def _worker(name, fn, inq, outq, options, failures, metrics):
+    while True:
+        item = inq.get()
+        if item is _DONE:
+            return
+        start = time.perf_counter()
+        try:
+            item = fn(item, options)
+            metrics.record(time.perf_counter() - start, bytes_written=item.pop("written", 0))
+            outq.put(item)
+        except Exception as e:
+            metrics.record(time.perf_counter() - start, failed=True)
+            failures.append((item["stem"], name, str(e)))
+            print(f"❌ {item['stem']} failed at {name}: {e}")
+            stage = item.get("current")
+            if options["manifest"] is not None and "hashes" in item:
+                options["manifest"].mark_failed(item["stem"], stage, item["hashes"][stage], str(e))
+
+def run_streaming_pipeline(n=1000, workers=None, keep_intermediates=False, manifest=None,
+                           shard_index=0, shard_count=1, seed=SEED, template_seed=TEMPLATE_SEED):
+    """Generate n resumes and stream each one through every stage.
+
+    seed and template_seed pick the records and templates as in
+    generate_resumes.py and batch_render.py. workers overrides STAGE_WORKERS
+    per stage name. With a manifest.Manifest,
+    stages whose inputs are unchanged since a previous run are skipped. With
+    shard_count > 1 only node shard_index's part of the n resumes is made.
+    Returns (completed_count, failures) where failures lists
+    (stem, stage, error).
+    """
+    total = sum(stop - first for first, stop in owned_ranges(n, shard_index, shard_count))
+    workers = {**STAGE_WORKERS, **(workers or {})}
+    options = {"keep_intermediates": keep_intermediates, "manifest": manifest}
+    for directory in (PDF_DIR, CLEAN_DIR, NOISY_DIR, ANNOT_DIR, NOISY_ANNOT_DIR):
+        directory.mkdir(parents=True, exist_ok=True)
+    if keep_intermediates:
+        HTML_DIR.mkdir(parents=True, exist_ok=True)
+
+    queues = [queue.Queue(maxsize=STAGE_QUEUE_SIZES.get(name, QUEUE_SIZE)) for name, _ in STAGES]
+    queues.append(queue.Queue(maxsize=QUEUE_SIZE))
+    failures = []
+    stage_threads = []
+    # Per-stage progress lines would interleave; the collector reports overall progress
+    clear_stage_metrics()
+    stage_metrics = {
+        name: StageMetrics(name, total=total, workers=workers[name], progress=False)
+        for name, _ in STAGES
+    }
+    for (name, fn), inq, outq in zip(STAGES, queues, queues[1:]):
+        threads = [
+            threading.Thread(
+                target=_worker,
+                args=(name, fn, inq, outq, options, failures, stage_metrics[name]),
+                daemon=True
+            )
+            for _ in range(workers[name])
+        ]
+        for t in threads:
+            t.start()
+        stage_threads.append(threads)
+
+    def source():
+        """Yield generated (idx, resume) records for the JSON shards while feeding the first stage."""
+        # The same generator as save_resumes()'s default, so both modes build the same records
+        for idx, data in iter_resume_records(n, seed, shard_index=shard_index, shard_count=shard_count):
+            yield idx, data
+            template_id = template_for(idx, template_seed)
+            queues[0].put({
+                "idx": idx,
+                "stem": resume_stem(idx, template_id),
+                "template_id": template_id,
+                "data": data
+            })
+
+    def feed():
+        try:
+            write_indexed_shards(source())
+        finally:
+            for _ in stage_threads[0]:
+                queues[0].put(_DONE)
+
+    def shut_down():
+        # Close each stage once the one before it has drained
+        for i, threads in enumerate(stage_threads):
+            for t in threads:
+                t.join()
+            downstream = len(stage_threads[i + 1]) if i + 1 < len(stage_threads) else 1
+            for _ in range(downstream):
+                queues[i + 1].put(_DONE)
+
+    start = time.time()
+    feeder = threading.Thread(target=feed, daemon=True)
+    feeder.start()
+    closer = threading.Thread(target=shut_down, daemon=True)
+    closer.start()
+
+    completed = 0
+    skipped = 0
+    while True:
+        item = queues[-1].get()
+        if item is _DONE:
+            break
+        completed += 1
+        if not item["todo"]:
+            skipped += 1
+        elapsed = time.time() - start
+        if completed - skipped == 1 and item["todo"]:
+            print(f"✓ First sample ready after {elapsed:.1f}s: {item['png'].name}")
+        if completed % 100 == 0:
+            rate = completed / elapsed
+            print(f"✓ {completed}/{total} samples ({rate:.1f}/s, ETA {format_eta((total - completed) / rate)})")
+
+    feeder.join()
+    print(f"\n✓ Streaming pipeline finished in {time.time() - start:.1f}s")
+    print(f"  Completed: {completed}")
+    if manifest is not None:
+        print(f"  Up to date (skipped): {skipped}")
+    print(f"  Failed: {len(failures)}")
+
+    summaries = [m.save() for m in stage_metrics.values()]
+    print_report(summaries)
+    print(f"  Metrics: {write_report(summaries)}")
+    return completed, failures
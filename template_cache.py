@@ -0,0 +1,66 @@
+"""
+Per-template cache of resume.html with style.css already inlined.
+
+Each template is read from disk once per process, so rendered HTML is
+self-contained and can be handed to wkhtmltopdf without path fix-ups.
+Templates are also compiled once into literal chunks and slots for
+batch_render.
+"""
+from functools import lru_cache
+from pathlib import Path
+import re
+
+TEMPLATES_DIR = Path("templates")
+
+CSS_LINK_TAG = '<link rel="stylesheet" href="style.css">'
+
+def template_dir(template_id):
+    """Directory of a template given as 7, "7" or "07"."""
+    return TEMPLATES_DIR / f"template_{int(template_id):02d}"
+
+@lru_cache(maxsize=None)
+def load_css(template_id):
+    """Return the template's style.css, or None if it has none."""
+    css_path = template_dir(template_id) / "style.css"
+    if not css_path.exists():
+        return None
+    with open(css_path, "r", encoding="utf-8") as f:
+        return f.read()
+
+def inline_css(html_content, css_content):
+    """Replace the style.css link tag with an inline <style> block."""
+    if css_content is None:
+        return html_content
+    return html_content.replace(CSS_LINK_TAG, f"<style>\n{css_content}\n    </style>")
+
+@lru_cache(maxsize=None)
+def load_template(template_id):
+    """Return the template's resume.html with its CSS inlined."""
+    with open(template_dir(template_id) / "resume.html", "r", encoding="utf-8") as f:
+        html_content = f.read()
+    return inline_css(html_content, load_css(template_id))
+
+# Compiled templates: resume.html split once into literal chunks and
+# {{slot}} names, so rendering is a single join instead of one full-string
+# str.replace pass per placeholder.
+PLACEHOLDER_RE = re.compile(r"\{\{(\w+)\}\}")
+
+def compile_template(html_content):
+    """Split HTML into a tuple of literals (even indexes) and slot names (odd indexes)."""
+    return tuple(PLACEHOLDER_RE.split(html_content))
+
+@lru_cache(maxsize=None)
+def load_compiled_template(template_id):
+    """Return the compiled, CSS-inlined template for template_id."""
+    return compile_template(load_template(template_id))
+
+def render_template(compiled, values):
+    """Fill a compiled template's slots from values in one pass.
+
+    Slots missing from values are left as their {{placeholder}} text.
+    """
+    parts = list(compiled)
+    for i in range(1, len(parts), 2):
+        name = parts[i]
+        parts[i] = values[name] if name in values else f"{{{{{name}}}}}"
+    return "".join(parts)
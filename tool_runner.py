@@ -0,0 +1,127 @@
+"""
+Asyncio job runner for external tools (wkhtmltopdf, pdftoppm).
+
+Every job is a coroutine that spends its time waiting on a child process,
+so one event loop can keep `concurrency` processes running without a thread
+per job. The runner provides:
+
+- a concurrency limit, with jobs started lazily from an iterable,
+- a timeout per attempt, after which the process is killed,
+- retries with exponential backoff (a missing binary is not retried),
+- stdout/stderr capture; failures raise ToolError with the last stderr
+  line as message and the full stderr attached,
+- results streamed back in completion order, and
+- cancellation: closing the result stream, or Ctrl+C, kills every running
+  process before returning.
+"""
+import asyncio
+import os
+import signal
+import subprocess
+import time
+
+MAX_CONCURRENCY = os.cpu_count() or 4
+JOB_TIMEOUT = 120  # seconds per attempt
+MAX_RETRIES = 2    # extra attempts after the first failure
+BACKOFF = 0.5      # seconds before the first retry, doubled for each further one
+
+# On POSIX each job gets its own process group, so killing it also stops
+# anything the tool started (which would otherwise hold its pipes open)
+NEW_SESSION = os.name == "posix"
+
+class ToolError(Exception):
+    """An external tool job that failed; str() is a one-line reason."""
+
+    def __init__(self, message, stderr=""):
+        super().__init__(message)
+        self.stderr = stderr
+
+async def _kill(proc):
+    try:
+        if NEW_SESSION:
+            os.killpg(proc.pid, signal.SIGKILL)
+        else:
+            proc.kill()
+    except ProcessLookupError:
+        pass
+    await proc.wait()
+
+async def run_tool(command, stdin=None, timeout=JOB_TIMEOUT, retries=MAX_RETRIES, backoff=BACKOFF):
+    """Run command to completion, retrying failures. Returns its stdout.
+
+    stdin (bytes) is fed to the process. Raises ToolError once every
+    attempt has failed or timed out.
+    """
+    command = [str(part) for part in command]
+    error, stderr = None, ""
+    for attempt in range(retries + 1):
+        if attempt:
+            await asyncio.sleep(backoff * 2 ** (attempt - 1))
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                *command,
+                stdin=subprocess.DEVNULL if stdin is None else subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                start_new_session=NEW_SESSION
+            )
+        except OSError as e:
+            # Missing binary or similar - retrying will not help
+            raise ToolError(str(e)) from e
+
+        try:
+            stdout, err = await asyncio.wait_for(proc.communicate(stdin), timeout)
+        except asyncio.TimeoutError:
+            await _kill(proc)
+            error = f"timed out after {timeout}s"
+            continue
+        except asyncio.CancelledError:
+            await _kill(proc)
+            raise
+
+        if proc.returncode == 0:
+            return stdout
+        stderr = err.decode("utf-8", errors="replace").strip()
+        error = f"exit code {proc.returncode}" + (f": {stderr.splitlines()[-1]}" if stderr else "")
+    raise ToolError(f"{error} (after {retries + 1} attempts)", stderr)
+
+def run_tool_sync(command, stdin=None, timeout=JOB_TIMEOUT, retries=MAX_RETRIES):
+    """run_tool() for synchronous callers, e.g. the streaming pipeline's worker threads."""
+    return asyncio.run(run_tool(command, stdin, timeout, retries))
+
+async def _run_job(key, fn, args):
+    start = time.perf_counter()
+    try:
+        result, error = await fn(*args), None
+    except Exception as e:
+        result, error = None, str(e) or type(e).__name__
+    return key, time.perf_counter() - start, result, error
+
+def stream_jobs(jobs, concurrency=MAX_CONCURRENCY):
+    """Run async jobs, at most concurrency at a time, yielding each as it finishes.
+
+    jobs is an iterable of (key, coroutine function, args), consumed only as
+    slots free up. Yields (key, seconds, result, error or None). Jobs still
+    running when the generator is closed or interrupted are cancelled, which
+    kills their processes.
+    """
+    jobs = iter(jobs)
+    loop = asyncio.new_event_loop()
+    running = set()
+    try:
+        while True:
+            while len(running) < concurrency and (job := next(jobs, None)) is not None:
+                running.add(loop.create_task(_run_job(*job)))
+            if not running:
+                return
+            done, running = loop.run_until_complete(
+                asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            )
+            for task in done:
+                yield task.result()
+    finally:
+        for task in running:
+            task.cancel()
+        if running:
+            loop.run_until_complete(asyncio.gather(*running, return_exceptions=True))
+        loop.close()
@@ -1,132 +1,315 @@
 """
 Dataset verification and statistics script.
 Checks all generated files and reports distribution across templates.
+
+Every PNG is decoded, every label is parsed and its boxes validated, every
+PDF is checked for a header and end marker, and the stems of each stage are
+cross-checked per resume. Checks run on a thread pool and results are
+cached in output/verify_cache.sqlite by (mtime, size, SHA-1), so a re-run
+only re-checks files that changed.
 """
 
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-import json
+import hashlib
+import io
+import os
 import re
+import sqlite3
 from collections import Counter
 
+from PIL import Image
+
+from create_annotations import CLASS_MAP
+from dataset_paths import (
+    ANNOT_DIR, CLEAN_DIR, HTML_DIR, IMAGE_SUFFIXES, NOISY_ANNOT_DIR, NOISY_DIR, PDF_DIR, base_stem, iter_files,
+    parse_stem
+)
+from html_to_pdf import load_batch_index
+from resume_store import DATA_DIR, count_resumes, load_index
+
+CACHE_PATH = Path("output/verify_cache.sqlite")
+CHECKS_VERSION = 2  # bump when a check changes, so cached results are redone
+MAX_WORKERS = os.cpu_count() or 4
+
+CLASS_IDS = set(CLASS_MAP.values())
+
 def extract_template_id(filename):
     """Extract template ID from filename."""
     match = re.search(r'_t(\d{2})', filename)
     return match.group(1) if match else None
 
-def verify_dataset():
+def record_number(stem):
+    """1-based resume number encoded in a stem, or None if it is not a resume stem."""
+    parsed = parse_stem(stem)
+    return parsed[0] if parsed else None
+
+def list_stems(directory, suffix):
+    """{stem: path} for the files in directory (and its shards) ending in suffix(es)."""
+    return {path.name.split(".", 1)[0]: path for path in iter_files(directory, suffix)}
+
+# -------------------------------
+# FILE CHECKS
+# -------------------------------
+
+def check_image(data, expected):
+    with Image.open(io.BytesIO(data)) as img:
+        if img.format != expected:
+            raise ValueError(f"not a {expected} ({img.format})")
+        img.load()  # full decode
+
+def check_label(data):
+    # An empty file is a valid label for a page without boxes (measured
+    # labels skip sections they cannot find, rotation drops boxes off the page)
+    lines = data.decode("ascii").splitlines()
+    for n, line in enumerate(lines, start=1):
+        fields = line.split()
+        if len(fields) != 5:
+            raise ValueError(f"line {n}: expected 5 fields, got {len(fields)}")
+        if int(fields[0]) not in CLASS_IDS:
+            raise ValueError(f"line {n}: unknown class {fields[0]}")
+        x, y, w, h = map(float, fields[1:])
+        if not (0 < w <= 1 and 0 < h <= 1):
+            raise ValueError(f"line {n}: box size out of range")
+        eps = 1e-6
+        if x - w / 2 < -eps or x + w / 2 > 1 + eps or y - h / 2 < -eps or y + h / 2 > 1 + eps:
+            raise ValueError(f"line {n}: box outside the page")
+
+def check_pdf(data):
+    if not data.startswith(b"%PDF-"):
+        raise ValueError("missing %PDF header")
+    if b"%%EOF" not in data[-1024:]:
+        raise ValueError("missing %%EOF (truncated?)")
+
+CHECKS = {
+    ".png": lambda data: check_image(data, "PNG"),
+    ".webp": lambda data: check_image(data, "WEBP"),
+    ".jpg": lambda data: check_image(data, "JPEG"),
+    ".txt": check_label,
+    ".pdf": check_pdf
+}
+
+def verify_file(path, cached):
+    """Check one file, reusing the cached result when it is unchanged.
+
+    cached is (mtime_ns, size, sha1, error) or None. Returns
+    (path, mtime_ns, size, sha1, error) where error is None for a good file.
+    """
+    st = os.stat(path)
+    if cached is not None and cached[:2] == (st.st_mtime_ns, st.st_size):
+        return (str(path), *cached)
+
+    data = path.read_bytes()
+    sha1 = hashlib.sha1(data).hexdigest()
+    # Touched but identical content: keep the earlier result
+    if cached is not None and cached[2] == sha1:
+        return (str(path), st.st_mtime_ns, st.st_size, sha1, cached[3])
+
+    try:
+        CHECKS[path.suffix](data)
+        error = None
+    except Exception as e:
+        error = str(e) or type(e).__name__
+    return (str(path), st.st_mtime_ns, st.st_size, sha1, error)
+
+def open_cache(path=CACHE_PATH):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(path))
+    if conn.execute("PRAGMA user_version").fetchone()[0] != CHECKS_VERSION:
+        conn.execute("DROP TABLE IF EXISTS files")
+        conn.execute(f"PRAGMA user_version = {CHECKS_VERSION}")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS files (
+            path TEXT PRIMARY KEY,
+            mtime_ns INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            sha1 TEXT NOT NULL,
+            error TEXT
+        )
+    """)
+    return conn
+
+def verify_files(paths, workers=MAX_WORKERS, cache_path=CACHE_PATH):
+    """Check every path on a thread pool.
+
+    Returns ({path: (size, error)}, rechecked_count).
+    """
+    conn = open_cache(cache_path)
+    cache = {
+        row[0]: row[1:]
+        for row in conn.execute("SELECT path, mtime_ns, size, sha1, error FROM files")
+    }
+
+    results = {}
+    changed = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for row in pool.map(lambda p: verify_file(p, cache.get(str(p))), paths):
+            results[row[0]] = (row[2], row[4])
+            if cache.get(row[0]) != row[1:]:
+                changed.append(row)
+
+    stale = [(p,) for p in cache.keys() - results.keys()]
+    with conn:
+        conn.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)", changed)
+        conn.executemany("DELETE FROM files WHERE path = ?", stale)
+    conn.close()
+    return results, len(changed)
+
+# -------------------------------
+# REPORT
+# -------------------------------
+
+def verify_dataset(workers=MAX_WORKERS, data_dir=DATA_DIR, html_dir=HTML_DIR, pdf_dir=PDF_DIR, clean_dir=CLEAN_DIR,
+                   noisy_dir=NOISY_DIR, annot_dir=ANNOT_DIR, noisy_annot_dir=NOISY_ANNOT_DIR, cache_path=CACHE_PATH):
+    """Check every stage's output in the given folders and print statistics.
+
+    Returns True if no issue was found.
+    """
     print("\n" + "="*70)
     print(" DATASET VERIFICATION & STATISTICS")
     print("="*70)
-    
+
     # Check JSON resumes
-    json_dir = Path("data/resumes")
-    json_files = list(json_dir.glob("*.json"))
-    print(f"\n✓ JSON Resumes: {len(json_files)} files")
-    
+    json_count = count_resumes(data_dir)
+    store = "JSONL shards" if load_index(data_dir) is not None else "files"
+    print(f"\n✓ JSON Resumes: {json_count} records ({store})")
+
     # Check HTML files
-    html_dir = Path("output/html")
-    html_files = list(html_dir.glob("*.html"))
-    print(f"✓ HTML Files: {len(html_files)} files")
-    
-    # Analyze template distribution in HTML files
-    if html_files:
-        html_templates = [extract_template_id(f.name) for f in html_files]
-        html_templates = [t for t in html_templates if t]  # Filter None
-        template_counts = Counter(html_templates)
-        
-        print("\n  Template Distribution (HTML):")
-        for template_id in sorted(template_counts.keys()):
-            count = template_counts[template_id]
-            bar = "█" * (count // 5)  # Visual bar chart
-            print(f"    Template {template_id}: {count:4d} {bar}")
-    
+    html_stems = list_stems(html_dir, ".html")
+    print(f"✓ HTML Files: {len(html_stems)} files")
+
     # Check PDF files
-    pdf_dir = Path("output/pdf")
-    pdf_files = list(pdf_dir.glob("*.pdf"))
-    print(f"\n✓ PDF Files: {len(pdf_files)} files")
-    
+    pdf_files = list(list_stems(pdf_dir, ".pdf").values())
+    # Batched PDFs hold many resumes; count them by their page index
+    pdf_stems = set()
+    for pdf in pdf_files:
+        pages = load_batch_index(pdf)
+        if pages is not None:
+            pdf_stems.update(entry["stem"] for entry in pages)
+        else:
+            pdf_stems.add(pdf.stem)
+    print(f"✓ PDF Files: {len(pdf_files)} files ({len(pdf_stems)} resumes)")
+
     # Check images
-    clean_dir = Path("output/images/clean")
-    noisy_dir = Path("output/images/noisy")
-    clean_images = list(clean_dir.glob("*.png"))
-    noisy_images = list(noisy_dir.glob("*.png"))
-    
-    print(f"✓ Clean Images: {len(clean_images)} files")
-    print(f"✓ Noisy Images: {len(noisy_images)} files")
-    
+    clean_stems = list_stems(clean_dir, IMAGE_SUFFIXES)
+    noisy_stems = list_stems(noisy_dir, IMAGE_SUFFIXES)
+    print(f"✓ Clean Images: {len(clean_stems)} files")
+    # Noisy variant k > 0 of a resume is named <stem>_v<k>
+    noisy_resumes = {base_stem(s) for s in noisy_stems}
+    variants = f" ({len(noisy_stems) / len(noisy_resumes):.3g} per resume)" if noisy_resumes else ""
+    print(f"✓ Noisy Images: {len(noisy_stems)} files{variants}")
+
     # Check annotations
-    annot_dir = Path("annotations")
-    annot_files = list(annot_dir.glob("*.txt"))
-    print(f"✓ Annotation Files: {len(annot_files)} files")
-    
-    # Verify annotation format
-    if annot_files:
-        sample_annot = annot_files[0]
-        with open(sample_annot) as f:
-            lines = f.readlines()
-        print(f"\n  Sample annotation ({sample_annot.name}):")
-        print(f"    Lines: {len(lines)} (expected: 6 sections)")
-        if lines:
-            print(f"    Format: {lines[0].strip()}")
-    
+    annot_stems = list_stems(annot_dir, ".txt")
+    noisy_annot_stems = list_stems(noisy_annot_dir, ".txt")
+    print(f"✓ Annotation Files: {len(annot_stems)} files")
+    if noisy_annot_stems:
+        print(f"✓ Noisy Annotation Files: {len(noisy_annot_stems)} files")
+
+    # Analyze template distribution
+    named = html_stems or clean_stems
+    template_counts = Counter(t for t in map(extract_template_id, named) if t)
+    if template_counts:
+        source = "HTML" if html_stems else "clean images"
+        print(f"\n  Template Distribution ({source}):")
+        for template_id in sorted(template_counts.keys()):
+            count = template_counts[template_id]
+            bar = "█" * (count * 50 // max(template_counts.values()))  # Visual bar chart
+            print(f"    Template {template_id}: {count:7d} {bar}")
+
+    # Integrity checks
+    files = (
+        pdf_files + list(clean_stems.values()) + list(noisy_stems.values())
+        + list(annot_stems.values()) + list(noisy_annot_stems.values())
+    )
+    print(f"\n🔍 Checking {len(files)} files ({workers} workers)...")
+    results, rechecked = verify_files(files, workers, Path(cache_path))
+    corrupt = sorted((path, error) for path, (_, error) in results.items() if error is not None)
+    print(f"✓ Checked {len(results)} files ({rechecked} new or changed, {len(results) - rechecked} cached)")
+
     # Check templates
     templates_dir = Path("templates")
     templates = [d for d in templates_dir.iterdir() if d.is_dir()]
     print(f"\n✓ Templates: {len(templates)} folders")
-    
+
     for template in sorted(templates):
         has_html = (template / "resume.html").exists()
         has_css = (template / "style.css").exists()
         has_config = (template / "layout_config.json").exists()
-        
+
         status = "✓" if (has_html and has_css and has_config) else "✗"
         print(f"  {status} {template.name}: HTML={has_html} CSS={has_css} Config={has_config}")
-    
+
     # Overall summary
     print("\n" + "="*70)
     print(" SUMMARY")
     print("="*70)
-    
-    expected = 1000
+
+    expected = json_count
     issues = []
-    
-    if len(json_files) != expected:
-        issues.append(f"JSON files: {len(json_files)} (expected {expected})")
-    if len(html_files) != expected:
-        issues.append(f"HTML files: {len(html_files)} (expected {expected})")
-    if len(pdf_files) != expected:
-        issues.append(f"PDF files: {len(pdf_files)} (expected {expected})")
-    if len(clean_images) != expected:
-        issues.append(f"Clean images: {len(clean_images)} (expected {expected})")
-    if len(noisy_images) != expected:
-        issues.append(f"Noisy images: {len(noisy_images)} (expected {expected})")
-    if len(annot_files) != expected:
-        issues.append(f"Annotations: {len(annot_files)} (expected {expected})")
-    
+
+    # Per-resume cross-check: every stage that has output must have one file
+    # per JSON record, and all stages must agree on each resume's stem
+    stages = [
+        ("HTML files", set(html_stems)),
+        ("PDF resumes", pdf_stems),
+        ("Clean images", set(clean_stems)),
+        ("Noisy images", noisy_resumes),
+        ("Annotations", set(annot_stems))
+    ]
+    for name, stems in stages:
+        if not stems and name in ("HTML files", "PDF resumes"):
+            continue  # intermediates are deleted in streaming mode
+        if len(stems) != expected:
+            issues.append(f"{name}: {len(stems)} (expected {expected})")
+        unknown = [s for s in stems if not 1 <= (record_number(s) or 0) <= expected]
+        if unknown:
+            issues.append(f"{name}: {len(unknown)} without a matching JSON record, e.g. {min(unknown)}")
+
+    clean = set(clean_stems)
+    for name, stems in stages[3:]:
+        orphans = stems - clean
+        missing = clean - stems
+        if orphans:
+            issues.append(f"{name}: {len(orphans)} without a clean image, e.g. {min(orphans)}")
+        if missing:
+            issues.append(f"{name}: missing for {len(missing)} clean images, e.g. {min(missing)}")
+
+    # Rotated labels are optional, but when present every noisy image needs one
+    if noisy_annot_stems:
+        orphans = noisy_annot_stems.keys() - noisy_stems.keys()
+        missing = noisy_stems.keys() - noisy_annot_stems.keys()
+        if orphans:
+            issues.append(f"Noisy annotations: {len(orphans)} without a noisy image, e.g. {min(orphans)}")
+        if missing:
+            issues.append(f"Noisy annotations: missing for {len(missing)} noisy images, e.g. {min(missing)}")
+
+    for path, error in corrupt:
+        issues.append(f"Corrupt {path}: {error}")
+
     if not issues:
         print("\n✅ All checks passed! Dataset is complete.")
         print(f"   Total resumes: {expected}")
-        print(f"   Total images: {len(clean_images) + len(noisy_images)}")
+        print(f"   Total images: {len(clean_stems) + len(noisy_stems)}")
         print(f"   Templates used: {len(template_counts)}")
     else:
         print("\n⚠️  Issues found:")
-        for issue in issues:
+        for issue in issues[:50]:
             print(f"   - {issue}")
-    
-    # File size estimation
+        if len(issues) > 50:
+            print(f"   ... and {len(issues) - 50} more")
+
+    # Storage, from the sizes recorded while checking
+    sizes = {path: size for path, (size, _) in results.items()}
+    pdf_size = sum(sizes[str(p)] for p in pdf_files)
+    image_size = sum(sizes[str(p)] for p in (*clean_stems.values(), *noisy_stems.values()))
     if pdf_files:
-        total_size = sum(f.stat().st_size for f in pdf_files[:10])  # Sample 10 files
-        avg_size = total_size / 10
-        estimated_total = (avg_size * len(pdf_files)) / (1024**2)  # MB
-        print(f"\n💾 Estimated PDF storage: {estimated_total:.1f} MB")
-    
-    if clean_images:
-        total_size = sum(f.stat().st_size for f in clean_images[:10])
-        avg_size = total_size / 10
-        estimated_total = (avg_size * (len(clean_images) + len(noisy_images))) / (1024**2)
-        print(f"💾 Estimated Image storage: {estimated_total:.1f} MB")
-    
+        print(f"\n💾 PDF storage: {pdf_size / 1024**2:.1f} MB")
+    if clean_stems:
+        print(f"💾 Image storage: {image_size / 1024**2:.1f} MB")
+
     print("\n" + "="*70)
+    return not issues
 
 if __name__ == "__main__":
     verify_dataset()